@@ -1,6 +1,7 @@
 import random
 from uuid import uuid4
 
+import numpy as np
 import pygame
 from pygame.sprite import Sprite
 
@@ -9,13 +10,171 @@ import src.helper as helper
 from src.enums import Attributes, Defence, EventType, MessagePacket, Shapes, MatingState
 from src.handlers.genetics import Genome
 
+# Mating states by their code in CritterStore.mating_state
+MATING_STATES = tuple(MatingState)
+MATING_CODES = {state: code for code, state in enumerate(MATING_STATES)}
+
+
+class CritterStore:
+    """Scalar state of a population of critters, one NumPy column per attribute
+    and one row per critter, so each tick's bookkeeping is a few array passes.
+
+    Rows 0 to `count` are in use, and `critters` holds the critter of each row.
+    Critters read and write their row through StoreColumn attributes. A
+    critter removed from the store keeps its values in a store of its own.
+    """
+
+    COLUMNS = {
+        "alive": bool,
+        "time": np.int64,
+        "age": np.int64,
+        "max_lifespan": np.int64,
+        "energy": np.int64,
+        "max_energy": np.int64,
+        "fitness": np.int64,
+        "defense_active": bool,
+        "mating_state": np.int8,
+        "current_mating_timeout": np.int64,
+        "age_of_maturity": np.int64,
+        "requested": bool,  # Whether there is an incoming mate request
+        "x": float,  # Center of the critter, in environment coordinates
+        "y": float,
+        "anchor_x": float,  # Where the critter started the tick
+        "anchor_y": float,
+        "max_speed": np.int64,
+        "angle": float,  # Heading of the wandering movement, in radians
+    }
+
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.critters = []
+        for name, dtype in self.COLUMNS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def add(self, critter):
+        """Gives `critter` the next row, growing the columns when they are full."""
+        capacity = len(self.alive)
+        if self.count == capacity:
+            for name in self.COLUMNS:
+                column = getattr(self, name)
+                grown = np.zeros(2 * capacity, dtype=column.dtype)
+                grown[:capacity] = column
+                setattr(self, name, grown)
+
+        critter.store = self
+        critter.slot = self.count
+        self.critters.append(critter)
+        self.count += 1
+
+    def remove(self, critter):
+        """Takes `critter` out, along with its values, and moves the last row
+        into its place to keep the rows in use contiguous."""
+        slot = critter.slot
+        last = self.count - 1
+        detached = CritterStore(capacity=1)
+        detached.add(critter)
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            getattr(detached, name)[0] = column[slot]
+            column[slot] = column[last]
+
+        moved = self.critters.pop()
+        if moved is not critter:
+            self.critters[slot] = moved
+            moved.slot = slot
+        self.count = last
+
+    def begin_step(self):
+        """Ages every living critter by a tick, lets those out of energy or
+        lifespan die, and moves mating states on. Returns the critters still
+        alive to act, in row order."""
+        n = self.count
+        alive = self.alive[:n]
+        self.time[:n] += alive
+        self.age[:n] += alive
+        self.energy[:n] -= alive
+        age = self.age[:n]
+        alive &= (self.energy[:n] > 0) & (age < self.max_lifespan[:n])
+
+        timeout = self.current_mating_timeout[:n]
+        timeout -= alive
+        state = self.mating_state[:n]
+        ready = MATING_CODES[MatingState.READY]
+        matured = (state == MATING_CODES[MatingState.MINOR]) & (
+            age >= self.age_of_maturity[:n]
+        )
+        rested = (state == MATING_CODES[MatingState.NOT_READY]) & (timeout <= 0)
+        # Mate requests are between critter objects, so those go one by one.
+        answering = np.flatnonzero(
+            alive
+            & (
+                ((state == ready) & self.requested[:n])
+                | (state == MATING_CODES[MatingState.WAITING])
+            )
+        )
+        state[alive & (matured | rested)] = ready
+        for i in answering.tolist():
+            self.critters[i].answer_mate_requests()
+
+        return [self.critters[i] for i in np.flatnonzero(alive).tolist()]
+
+    def end_step(self, world_size):
+        """Settles the tick's movement and caps the energy of every critter.
+        Each critter ends up at most max_speed from where it started along
+        each axis, wrapped around the edges of a world of `world_size`."""
+        n = self.count
+        max_speed = self.max_speed[:n]
+        for axis, anchor, size in (
+            (self.x[:n], self.anchor_x[:n], world_size[0]),
+            (self.y[:n], self.anchor_y[:n], world_size[1]),
+        ):
+            axis -= anchor
+            np.clip(axis, -max_speed, max_speed, out=axis)
+            axis += anchor
+            np.mod(axis, size, out=axis)
+            anchor[:] = axis
+
+        np.minimum(self.energy[:n], self.max_energy[:n], out=self.energy[:n])
+
+
+class StoreColumn:
+    """A Critter attribute held in its row of a CritterStore column."""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, critter, owner=None):
+        if critter is None:
+            return self
+        return getattr(critter.store, self.name).item(critter.slot)
+
+    def __set__(self, critter, value):
+        getattr(critter.store, self.name)[critter.slot] = value
+
 
 class Critter(Sprite):
-    def __init__(self, surface, context):
+    alive = StoreColumn()
+    time = StoreColumn()
+    age = StoreColumn()
+    max_lifespan = StoreColumn()
+    energy = StoreColumn()
+    max_energy = StoreColumn()
+    defense_active = StoreColumn()
+    current_mating_timeout = StoreColumn()
+    age_of_maturity = StoreColumn()
+    x = StoreColumn()
+    y = StoreColumn()
+    max_speed = StoreColumn()
+    angle = StoreColumn()
+
+    def __init__(self, surface, context, store=None, mutate=False):
         # Unique ID and inheritance setup
         self.id = uuid4()
         super().__init__()
 
+        # Scalar state lives in the population's store, or in one of our own
+        (store if store is not None else CritterStore(capacity=1)).add(self)
+
         # Backup context for crossover
         self.creation_context = context
 
@@ -23,7 +182,7 @@ class Critter(Sprite):
         position = context.get("position", None)
 
         # Genetic & species attributes
-        self.genome = Genome(context.get("genome"))
+        self.genome = Genome(context.get("genome"), mutate=mutate)
         self.species = context.get(Attributes.SPECIES)
         self.domain = context.get(Attributes.DOMAIN)
 
@@ -57,6 +216,8 @@ class Critter(Sprite):
         self.time = 0
         self.max_lifespan = context.get(Attributes.MAX_LIFESPAN)
         self.energy = self.max_energy
+        # Population totals this critter reports to, set once it is registered
+        self.ledger = None
         self.fitness = 0
 
         # Mating properties
@@ -72,14 +233,13 @@ class Critter(Sprite):
 
         # Movement properties
         self.td = random.randint(0, 1000)  # for pnoise generation
-        self.angle = 0  # degrees
+        self.angle = 0  # radians
         self.rotation = 0  # degrees
         self.max_speed = context.get(Attributes.MAX_SPEED)
 
         # Environment setup
         self.env_surface = surface
         self.seed = random.randint(0, 1000)
-        self.done = False
 
         # Positioning & visual rendering
         surface_size = (
@@ -91,20 +251,83 @@ class Critter(Sprite):
         # Center calculation
         self.center = (surface_size // 2, surface_size // 2)
 
+        # Position; the rects below are only centered on it when asked for
+        self.x, self.y = position or helper.get_random_position(surface)
+        self.store.anchor_x[self.slot] = self.x
+        self.store.anchor_y[self.slot] = self.y
+        self.creation_context["position"] = self.position
+
         # Rect & collision setup
-        self.rect = self.image.get_rect()
-        self.rect.center = position or helper.get_random_position(surface)
-        self.interaction_rect = self.rect.inflate(
+        self._rect = self.image.get_rect()
+        self._interaction_rect = self._rect.inflate(
             (-2 * self.vision["radius"]) + 10,
             (-2 * self.vision["radius"]) + 10,
         )
-        self.body_rect = self.rect.inflate(
-            -2 * self.vision["radius"] + 10,
-            -2 * self.vision["radius"] + 10,
+        self._body_rect = self._interaction_rect.copy()
+        # Half widths of the vision and body squares, for spatial queries
+        self.half_size = self._rect.width / 2
+        self.body_half_size = self._body_rect.width / 2
+
+    @property
+    def fitness(self):
+        return self.store.fitness.item(self.slot)
+
+    @fitness.setter
+    def fitness(self, value):
+        if self.ledger is not None:
+            self.ledger.add_fitness(self.species, value - self.fitness)
+        self.store.fitness[self.slot] = value
+
+    @property
+    def position(self):
+        return self.x, self.y
+
+    @property
+    def rect(self):
+        self._rect.center = self.position
+        return self._rect
+
+    @property
+    def body_rect(self):
+        self._body_rect.center = self.position
+        return self._body_rect
+
+    @property
+    def interaction_rect(self):
+        # Interaction rects are in screen coordinates, like mouse events.
+        self._interaction_rect.center = (
+            self.x + config.ENV_OFFSET_X,
+            self.y + config.ENV_OFFSET_Y,
         )
-        self.body_rect.center = self.center
-        self.previous_position = self.rect.center
-        self.creation_context["position"] = self.rect.center
+        return self._interaction_rect
+
+    def move(self, dx, dy):
+        """Moves the critter by (dx, dy). Positions are floats, so steps under
+        a pixel add up instead of being rounded away as on a rect. Species.step
+        holds the move to max_speed once everyone has acted."""
+        self.x += dx
+        self.y += dy
+
+    @property
+    def done(self):
+        return not self.alive
+
+    @property
+    def mating_state(self):
+        return MATING_STATES[self.store.mating_state.item(self.slot)]
+
+    @mating_state.setter
+    def mating_state(self, state):
+        self.store.mating_state[self.slot] = MATING_CODES[state]
+
+    @property
+    def incoming_mate_request(self):
+        return self._incoming_mate_request
+
+    @incoming_mate_request.setter
+    def incoming_mate_request(self, critter):
+        self._incoming_mate_request = critter
+        self.store.requested[self.slot] = critter is not None
 
     def draw(self, surface):
         if not self.alive:
@@ -120,11 +343,11 @@ class Critter(Sprite):
 
         color = self.color
 
-        self.body_rect = pygame.Rect(0, 0, self.size, self.size)
-        self.body_rect.center = self.center
+        body_rect = pygame.Rect(0, 0, self.size, self.size)
+        body_rect.center = self.center
 
         # temporary rect used to draw defense mechanism
-        defense_rect = self.body_rect.inflate(20, 20)
+        defense_rect = body_rect.inflate(20, 20)
 
         # Defense mechanism
         if self.defense_mechanism == Defence.SWORDLING:
@@ -147,54 +370,26 @@ class Critter(Sprite):
             if self.domain == Shapes.CIRCLE:
                 pygame.draw.circle(image_surface, color, self.center, self.size // 2)
             elif self.domain == Shapes.SQUARE:
-                pygame.draw.rect(image_surface, color, self.body_rect)
+                pygame.draw.rect(image_surface, color, body_rect)
             elif self.domain == Shapes.TRIANGLE:
-                points = helper.get_triangle_points(self.body_rect)
+                points = helper.get_triangle_points(body_rect)
                 pygame.draw.polygon(image_surface, color, points)
             elif self.domain == Shapes.PENTAGON:
-                points = helper.get_pentagon_points(self.body_rect)
+                points = helper.get_pentagon_points(body_rect)
                 pygame.draw.polygon(image_surface, color, points)
 
         surface.blit(self.image, self.rect)
 
-    def step(self, events):
-        if not self.done:
-            self.time += 1
-            self.age += 1
-            self.energy -= 1
-
-            if self.energy <= 0 or self.age >= self.max_lifespan:
-                self.die()
-                return
-
-            self.update_mating_state()
-
-            obs = self.genome.observe(self)
-            outputs = self.genome.forward(obs)
-            self.genome.step(outputs, self)
-            self.update_rect()
-
-            if self.energy > self.max_energy:
-                self.energy = self.max_energy
-
-    def update_mating_state(self):
-        self.current_mating_timeout -= 1
-
-        if self.mating_state == MatingState.MINOR:
-            if self.age >= self.age_of_maturity:
-                self.mating_state = MatingState.READY
-
-        elif self.mating_state == MatingState.READY:
+    def answer_mate_requests(self):
+        """The part of the mating state update that involves other critters;
+        CritterStore.begin_step does the rest for everyone at once."""
+        if self.mating_state == MatingState.READY:
             if self.incoming_mate_request:
                 if self.incoming_mate_request.mate == None:
                     self.set_mate(self.incoming_mate_request)
                     self.mate.set_mate(self)
             self.incoming_mate_request = None
 
-        elif self.mating_state == MatingState.NOT_READY:
-            if self.current_mating_timeout <= 0:
-                self.mating_state = MatingState.READY
-
         elif self.mating_state == MatingState.WAITING:
             if self.outgoing_mate_request:
                 if self.outgoing_mate_request.mate:
@@ -208,42 +403,6 @@ class Critter(Sprite):
             else:
                 self.mating_state = MatingState.READY
 
-        elif self.mating_state == MatingState.MATING:
-            pass
-
-    def update_rect(self):
-        # Enforce max movement offset
-        dx = max(
-            -self.max_speed,
-            min(self.max_speed, self.rect.centerx - self.previous_position[0]),
-        )
-        dy = max(
-            -self.max_speed,
-            min(self.max_speed, self.rect.centery - self.previous_position[1]),
-        )
-
-        # Apply the constrained movement
-        self.rect.centerx = (
-            self.previous_position[0] + dx
-        ) % self.env_surface.get_width()
-        self.rect.centery = (
-            self.previous_position[1] + dy
-        ) % self.env_surface.get_height()
-
-        # Update other rectangles
-        self.body_rect.center = self.rect.center
-        self.interaction_rect.center = self.rect.center
-
-        self.interaction_rect.centerx = (
-            self.interaction_rect.centerx + config.ENV_OFFSET_X
-        )
-        self.interaction_rect.centery = (
-            self.interaction_rect.centery + config.ENV_OFFSET_Y
-        )
-
-        # Store updated position
-        self.previous_position = self.rect.center
-
     def set_mate(self, mate):
         self.mating_state = MatingState.MATING
         self.mate = mate
@@ -267,12 +426,11 @@ class Critter(Sprite):
         }
         genotypes = self.genome.crossover(self.mate)
         phenotypes["genome"] = genotypes
-        phenotypes["position"] = self.rect.center
+        phenotypes["position"] = self.position
         self.FETUS = phenotypes
 
     def die(self):
         self.alive = False
-        self.done = True
 
     def eat(self):
         self.hunger -= 1
@@ -300,7 +458,7 @@ class Plant(Sprite):
         self.image = pygame.Surface(((2 * radius), (2 * radius)), pygame.SRCALPHA)
 
         # Random position within env_window bounds
-        self.position = pos or (
+        position = pos or (
             random.randint(radius + 75, env_surface.get_width() - radius - 75),
             random.randint(radius + 75, env_surface.get_height() - radius - 75),
         )
@@ -310,7 +468,13 @@ class Plant(Sprite):
 
         # Get rect for positioning
         self.rect = self.image.get_rect()
-        self.rect.center = self.position
+        self.rect.center = position
+        self.half_size = self.rect.width / 2
+
+    @property
+    def position(self):
+        # Follows the rect, which critters pull plants around by
+        return self.rect.center
 
     def draw(self, surface):
         # Blit the food image to the env_window at its position
@@ -5,7 +5,7 @@ import sys
 import pygame
 
 from src import helper
-from src.config import Colors, Fonts, image_assets
+from src.config import ENV_OFFSET_X, ENV_OFFSET_Y, Colors, Fonts, image_assets
 from src.enums import Attributes, EventType, MessagePacket, Pages, SurfDesc
 from src.handlers.organisms import Counter
 import webbrowser
@@ -179,10 +179,12 @@ class EnvComponent:
         self.surface.blit(self.env_image, (0, 0))
         self.plants = []
         self.critters = []
+        self.newborns = []
+        self.neighbor_search = None
 
     def event_handler(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
-            for critter in self.critters:
+            for critter in self._get_critters_near(event.pos):
                 if critter.interaction_rect.collidepoint(event.pos):
                     return MessagePacket(
                         EventType.NAVIGATION,
@@ -190,9 +192,24 @@ class EnvComponent:
                         context={"id": critter.id},
                     )
 
+    def _get_critters_near(self, pos):
+        """Narrows click hit-testing down to the critters around the pointer.
+        Critters created since the index was last built, such as while the
+        simulation is paused, are tested one by one."""
+        if self.neighbor_search is None:
+            return self.critters
+
+        # The clicked pixel in env coordinates, with a pixel to spare since the
+        # interaction rects it is tested against are rounded.
+        pointer = (pos[0] - ENV_OFFSET_X + 0.5, pos[1] - ENV_OFFSET_Y + 0.5)
+        unindexed = [critter for critter in self.newborns if critter.alive]
+        return self.neighbor_search.critters_near(pointer, 1.5) + unindexed
+
     def update(self, context=None):
         self.plants = context.get("plants")
         self.critters = context.get("critters")
+        self.neighbor_search = context.get("neighbor_search")
+        self.newborns = context.get("newborns", [])
 
         self.surface.fill(Colors.bg_color)
         self.surface.blit(self.env_image, (0, 0))
@@ -18,7 +18,7 @@ from src.enums import (
     SurfDesc,
     Shapes,
 )
-from src.handlers.genetics import NeuronManager
+from src.handlers.genetics import NeuronManager, innovation_history
 import src.helper as helper
 
 class Components(Enum):
@@ -524,7 +524,7 @@ class NeuralLab:
 
         # Define the new neuron properties
         new_neuron = {
-            "id": uuid.uuid4(),
+            "id": innovation_history.new_node_id(),
             "name": self.selected_neuron["name"],
             "type": self.selected_neuron["type"],
             SurfDesc.SURFACE: surface,
@@ -14,6 +14,17 @@ font_assets = os.path.join(assets, "fonts")
 ENV_OFFSET_X = 50
 ENV_OFFSET_Y = 100
 
+# Perception reuse: critters keep their neighbor candidates until they drift
+# PERCEPTION_SLACK px or PERCEPTION_MAX_AGE ticks pass. A slack of 0 disables it.
+PERCEPTION_SLACK = 0
+PERCEPTION_MAX_AGE = 10
+
+# Action memo: each compiled network remembers the action masks of its
+# ACTION_MEMO_SIZE most recent input vectors, with inputs rounded to multiples
+# of ACTION_MEMO_QUANTUM (0 keeps them exact). A size of 0 disables it.
+ACTION_MEMO_SIZE = 0
+ACTION_MEMO_QUANTUM = 0
+
 
 class Colors:
     bg_color = (26, 26, 26)
@@ -1,7 +1,9 @@
+import functools
 import math
 import random
 from tkinter import N
 import uuid
+import weakref
 import noise
 import numpy as np
 import pygame
@@ -10,9 +12,12 @@ from src.config import ENV_OFFSET_X, ENV_OFFSET_Y
 from src.enums import Attributes, Defence, NeuronType, MatingState
 from collections import defaultdict
 import src.helper as helper
+from src.handlers import networks, spatial
 
 
 class ConnectionGene:
+    __slots__ = ("in_node", "out_node", "weight", "enabled", "innovation")
+
     def __init__(self, in_node, out_node, weight, enabled, innovation):
         self.in_node = in_node
         self.out_node = out_node
@@ -22,6 +27,11 @@ class ConnectionGene:
 
 
 class NodeGene:
+    """A node of the genome graph. Node genes never change once made, so all
+    the genomes that carry a node id share one NodeGene for it."""
+
+    __slots__ = ("_id", "name", "type", "__weakref__")
+
     def __init__(self, node_id, node_name, node_type):
         self._id = node_id
         self.name = node_name
@@ -34,20 +44,26 @@ class NodeGene:
         return hash((self._id, self.type))
 
 
+# Node genes by id, for as long as any genome holds them.
+_node_genes = weakref.WeakValueDictionary()
+
+
 class Genome:
-    def __init__(self, genome_data):
+    def __init__(self, genome_data, mutate=False):
         self.node_genes = {}
         self.connection_genes = {}
         self.fitness = 0
         self.adjusted_fitness = 0
         self.species = None
         self.id = uuid.uuid4()
-        self.innovation_history = InnovationHistory()
+        self.innovation_history = innovation_history
         self.neuron_manager = genome_data.get("neuron_manager")
         self.sensors = []
         self.actuators = []
         self.bias = []
         self.hidden = []
+        self.network = None
+        self.reads_density = False
 
         if genome_data:
             for node_id, node_name, node_type in (
@@ -58,138 +74,111 @@ class Genome:
             ):
                 self.add_node_gene(node_id, node_name, node_type)
 
-            for node_1, node_2 in genome_data["connections"]:
+            connections = genome_data["connections"]
+            weights = [node_1[3] for node_1, _ in connections]
+            if mutate:
+                # A newborn mutates as its genes are laid down, so its network
+                # is compiled once, already mutated.
+                weights = self._perturb_weights(np.array(weights, float)).tolist()
+
+            # Crossover also passes on whether a connection is enabled; designs
+            # from the lab leave it out, and everything they draw is enabled.
+            for (node_1, node_2), weight in zip(connections, weights):
                 self.add_connection_gene(
-                    self.node_genes[node_1[0]], self.node_genes[node_2[0]], node_1[3]
+                    self.node_genes[node_1[0]],
+                    self.node_genes[node_2[0]],
+                    weight,
+                    node_1[4] if len(node_1) > 4 else True,
                 )
 
-            self.node_inputs, _, self.sorted_nodes, self.node_groups = (
-                self._resolve_nodes(genome_data)
-            )
-
-    def _resolve_nodes(self, genome_data):
-        output_map = {node._id: set() for node in self.node_genes.values()}
-        input_map = {node._id: set() for node in self.node_genes.values()}
-        undirected_map = {node._id: set() for node in self.node_genes.values()}
-
-        for node_1, node_2 in genome_data["connections"]:
-            node_1 = node_1[0]
-            node_2 = node_2[0]
-
-            input_map[node_2].add(node_1)
-            output_map[node_1].add(node_2)
-            undirected_map[node_1].add(node_2)
-            undirected_map[node_2].add(node_1)
-
-        node_groups = self.find_connected_nodes(undirected_map)
-        sorted_nodes = [self.node_genes[node_id] for node_id in helper.dfs(output_map)]
-        return input_map, output_map, sorted_nodes, node_groups
-
-    def find_connected_nodes(self, undirected_graph):
-        visited = []
-        components = []
-
-        for node in undirected_graph:
-            if node not in visited:
-                group = []
-                helper.dfs(undirected_graph, node, visited, group)
-                components.append(group)
-
-        return components
+            if mutate:
+                self._mutate_structure()
+            self._compile()
+
+    def _compile(self):
+        """Builds the network and everything looked up from it."""
+        self.network = networks.compile_genome(self)
+        self.observed_sensors, self.primed_sensors = self._resolve_sensors()
+        # Density tables are only built in ticks where some genome reads them.
+        self.reads_density = any(
+            node.name in NeuronManager.density_sensors
+            for node in self.observed_sensors + self.primed_sensors
+        )
+        if self.neuron_manager is not None:
+            self.sensor_calls, self.actuator_calls = self._resolve_calls()
+
+    def _resolve_sensors(self):
+        """Splits off the sensors the network reads from those it pruned. A
+        pruned sensor is still called, once per kind of finding, if it leaves
+        findings in the tick context that one of our actuators acts on."""
+        observed = [self.sensors[i] for i in self.network.sensor_slots]
+        observed_names = {node.name for node in observed}
+        actuator_names = {node.name for node in self.actuators}
+
+        primed = []
+        manager = NeuronManager
+        for key, sensor_names in manager.context_sensors.items():
+            if not actuator_names & set(manager.context_actuators[key]):
+                continue
+            if observed_names & set(sensor_names):
+                continue
+            for node in self.sensors:
+                if node.name in sensor_names:
+                    primed.append(node)
+                    break
+        return observed, primed
+
+    def _resolve_calls(self):
+        """Looks up every sensor and actuator this genome uses once, up front.
+        Sensor calls come in observation order, then the primed ones;
+        actuator calls line up with the action mask."""
+        manager = self.neuron_manager
+        for node in self.sensors:  # Pruned ones too; a bad design fails here
+            manager.get_sensor(node.name)
+
+        sensor_calls = tuple(
+            manager.get_sensor(node.name)
+            for node in self.observed_sensors + self.primed_sensors
+        )
+        actuator_calls = tuple(
+            manager.get_actuator(node.name) for node in self.actuators
+        )
+        return sensor_calls, actuator_calls
 
     def observe(self, critter):
-        observations = []
-        for neuron in self.node_genes.values():
-            if neuron.type == NeuronType.SENSOR:
-                if neuron.name in self.neuron_manager.sensors:
-                    sensor_method = getattr(self.neuron_manager, f"obs_{neuron.name}")
-                    observations.append(sensor_method(critter))
-                else:
-                    raise ValueError(f"Unknown sensor: {neuron}")
-        return observations
+        observations = [sensor(critter) for sensor in self.sensor_calls]
+        # Primed sensors only fill the context; the network never sees them.
+        return observations[: len(self.observed_sensors)]
 
     def forward(self, inputs):
-        if len(inputs) != len(self.sensors):
+        if len(inputs) != self.network.input_count:
             raise ValueError(
-                f"Expected {len(self.sensors)} inputs, but got {len(inputs)}."
+                f"Expected {self.network.input_count} inputs, but got {len(inputs)}."
             )
 
-        # Initialize sensor nodes with input values
-        activations = {node._id: value for node, value in zip(self.sensors, inputs)}
-
-        for node in self.node_genes.values():
-            # Initialize bias nodes to 1
-            if node.type == NeuronType.BIAS:
-                activations[node._id] = 1
-            # Initialize other nodes to 0
-            elif node.type != NeuronType.SENSOR:
-                activations[node._id] = 0
-
-        for node in self.sorted_nodes:
-            if node.type in [NeuronType.SENSOR, NeuronType.BIAS]:
-                continue
-
-            value = 0
-            for input_node in self.node_inputs.get(node._id, set()):
-                if conn := self.connection_genes.get((input_node, node._id), None):
-                    if conn.enabled:
-                        value += activations[input_node] * conn.weight
-            activations[node._id] = value
+        return self.apply_activation(self.network.forward(inputs))
 
-        self.apply_activation(activations)
-
-        return list(filter(lambda node: activations[node._id] == 1, self.actuators))
-
-    def apply_activation(self, activations):
-        """Applies the activation function to the value."""
-        # Uses a winner-takes-all activation function for the output layer
-        for group in self.node_groups:
-            actuators = self._get_nodes_from_id(group, NeuronType.ACTUATOR)
-            if not actuators:
-                continue
+    @staticmethod
+    def forward_batch(genomes, observations):
+        """forward() for many genomes at once, one row of `observations` each."""
+        return networks.forward_batch(
+            [genome.network for genome in genomes], observations
+        )
 
-            max_value = max(activations[node._id] for node in actuators)
-            if max_value < 0:
-                for node in actuators:
-                    activations[node._id] = 0.0
-            else:
-                for node in actuators:
-                    if activations[node._id] == max_value:
-                        activations[node._id] = 1.0
-                    else:
-                        activations[node._id] = 0.0
-
-    def _get_nodes_from_id(self, node_ids, node_type=None):
-        """Returns a list of nodes from the node_ids."""
-        nodes = []
-        for node_id in node_ids:
-            if node_id in self.node_genes:
-                node = self.node_genes[node_id]
-                if node_type is None or node.type == node_type:
-                    nodes.append(node)
-            else:
-                raise ValueError(f"Node ID {node_id} not found in genome.")
-        return nodes
-
-    def step(self, output_nodes, critter):
-        if output_nodes:
-            for output_node in output_nodes:
-                if output_node.name in self.neuron_manager.actuators:
-                    actuator_method = getattr(
-                        self.neuron_manager, f"act_{output_node.name}"
-                    )
-                    actuator_method(critter)
-                else:
-                    raise ValueError(f"Unknown actuator: {output_node.name}")
-        self.fitness = critter.fitness
+    def apply_activation(self, values):
+        """Applies winner-takes-all to each connected group of actuators and
+        returns the action mask: one flag per actuator, in actuator order."""
+        return self.network.winners(values[np.newaxis])[0]
 
-    def add_connection_gene(self, in_node, out_node, weight):
+    def add_connection_gene(self, in_node, out_node, weight, enabled=True):
         innovation = self.innovation_history.get_innovation(in_node._id, out_node._id)
-        connection = ConnectionGene(in_node, out_node, weight, True, innovation)
+        connection = ConnectionGene(in_node, out_node, weight, enabled, innovation)
         self.connection_genes[(in_node._id, out_node._id)] = connection
 
     def add_node_gene(self, node_id, node_name, node_type):
-        node = NodeGene(node_id, node_name, node_type)
+        node = _node_genes.get(node_id)
+        if node is None or node.name != node_name or node.type != node_type:
+            node = _node_genes[node_id] = NodeGene(node_id, node_name, node_type)
         self.node_genes[node_id] = node
         self.save_node(node_type, node)
         return node
@@ -205,49 +194,99 @@ class Genome:
             self.hidden.append(node)
 
     def mutate(self):
-        # Mutate connection weights with a probability of 80%
-        for connection in self.connection_genes:
-            if np.random.rand() < 0.8:
-                connection.weight += np.random.uniform(-0.1, 0.1)
-                connection.weight = np.clip(connection.weight, -1, 1)
+        """Mutates the genome in place and keeps its network in step: new
+        weights are swapped into the compiled network, and only a new structure
+        is compiled, or fetched if it has been seen. Newborns mutate while
+        their genome is built instead; see Genome(genome_data, mutate=True)."""
+        connections = list(self.connection_genes.values())
+        weights = self._perturb_weights(
+            np.array([conn.weight for conn in connections], dtype=float)
+        )
+        # The genes hold the weights, so the new ones are copied back gene by gene.
+        for connection, weight in zip(connections, weights.tolist()):
+            connection.weight = weight
 
+        if self._mutate_structure():
+            self._compile()
+        else:
+            self.network = self.network.with_weights(weights)
+
+    @staticmethod
+    def _perturb_weights(weights):
+        """Returns `weights` with 80% of them nudged by up to 0.1 within [-1, 1]."""
+        weights = weights.copy()
+        perturbed = np.flatnonzero(np.random.rand(len(weights)) < 0.8)
+        weights[perturbed] = np.clip(
+            weights[perturbed] + np.random.uniform(-0.1, 0.1, len(perturbed)), -1, 1
+        )
+        return weights
+
+    def _mutate_structure(self):
+        """Applies the structural mutations to the genes, without compiling.
+        Returns whether the structure changed."""
+        structural = False
         # Mutate add connection with a probability of 10%
         if np.random.rand() < 0.1:
-            in_node = np.random.choice(self.node_genes.values())
-            out_node = np.random.choice(self.node_genes.values())
-            if in_node._id != out_node._id:
-                self.add_connection_gene(in_node, out_node, np.random.uniform(-1, 1))
+            structural |= self._mutate_add_connection(self.sensors + self.hidden)
 
+        # Mutate add bias connection with a probability of 10%
         if np.random.rand() < 0.1:
-            out_node = np.random.choice(
-                [
-                    n
-                    for n in self.node_genes.values()
-                    if n.node_type in {NeuronType.HIDDEN, NeuronType.ACTUATOR}
-                ]
-            )
-            self.add_connection_gene(
-                self.bias_node_id, out_node, np.random.uniform(-1, 1)
-            )
+            structural |= self._mutate_add_connection(self.bias)
 
         # Mutate add node with a probability of 5%
         if np.random.rand() < 0.05:
-            connection = np.random.choice(self.connection_genes)
-            connection.enabled = False
-            new_node = self.add_node_gene(NeuronType.HIDDEN)
-            self.add_connection_gene(
-                connection,
-                new_node,
-                1,
-            )
-            self.add_connection_gene(
-                len(self.node_genes) - 1,
-                connection.out_node,
-                connection.weight,
-            )
+            structural |= self._mutate_add_node()
+        return structural
+
+    def _mutate_add_connection(self, sources):
+        """Connects a random node of `sources` to a hidden node or actuator it
+        does not feed yet, unless that would close a cycle. Returns whether a
+        connection was added."""
+        targets = self.hidden + self.actuators
+        if not sources or not targets:
+            return False
+
+        in_node = sources[np.random.randint(len(sources))]
+        out_node = targets[np.random.randint(len(targets))]
+        if (
+            in_node._id == out_node._id
+            or (in_node._id, out_node._id) in self.connection_genes
+            or in_node._id in self._downstream(out_node._id)
+        ):
+            return False
+
+        self.add_connection_gene(in_node, out_node, np.random.uniform(-1, 1))
+        return True
+
+    def _mutate_add_node(self):
+        """Splits a random enabled connection with a new hidden node. The old
+        connection is disabled; the new node passes its input on unchanged
+        and weighs its output as the old connection did. Returns whether a
+        node was added."""
+        enabled = [conn for conn in self.connection_genes.values() if conn.enabled]
+        if not enabled:
+            return False
+
+        connection = enabled[np.random.randint(len(enabled))]
+        connection.enabled = False
+        new_node = self.add_node_gene(
+            self.innovation_history.new_node_id(), "H", NeuronType.HIDDEN
+        )
+        self.add_connection_gene(connection.in_node, new_node, 1.0)
+        self.add_connection_gene(new_node, connection.out_node, connection.weight)
+        return True
+
+    def _downstream(self, node_id):
+        """Ids of the nodes reachable from `node_id` over connection genes."""
+        outgoing = defaultdict(set)
+        for in_id, out_id in self.connection_genes:
+            outgoing[in_id].add(out_id)
+        reached = set()
+        helper.dfs(outgoing, node_id, reached)
+        return reached
 
     def crossover(self, other_parent):
-        """Clones one parent's genome directly for the child, reassigning new node IDs."""
+        """Clones one parent's genome directly for the child, keeping its node IDs."""
         # We'll use self as the genome source
         source_genome = self
 
@@ -260,13 +299,9 @@ class Genome:
             "neuron_manager": self.neuron_manager,
         }
 
-        # Create a mapping from old node IDs to new ones
-        node_id_map = {}
-
+        # Node ids are population-wide, so the child's nodes keep them
         for node_id, node in source_genome.node_genes.items():
-            new_id = uuid.uuid4()
-            node_id_map[node_id] = new_id
-            child_genome_data[node.type].append((new_id, node.name, node.type))
+            child_genome_data[node.type].append((node_id, node.name, node.type))
 
         for key, conn in source_genome.connection_genes.items():
             if not conn.enabled and np.random.rand() >= 0.75:
@@ -278,13 +313,14 @@ class Genome:
             child_genome_data["connections"].append(
                 (
                     (
-                        node_id_map[in_node._id],
+                        in_node._id,
                         in_node.name,
                         in_node.type,
                         conn.weight,
+                        conn.enabled,
                     ),
                     (
-                        node_id_map[out_node._id],
+                        out_node._id,
                         out_node.name,
                         out_node.type,
                     ),
@@ -295,9 +331,21 @@ class Genome:
 
 
 class InnovationHistory:
+    """Population-wide record of structural innovations.
+
+    A connection between the same two nodes gets the same innovation number
+    in every genome, and node ids are small ints handed out by new_node_id(),
+    so genes line up across lineages and compare and hash as plain ints.
+    """
+
     def __init__(self):
         self.innovation = 0
         self.innovation_map = {}
+        self.node_count = 0
+
+    def new_node_id(self):
+        self.node_count += 1
+        return self.node_count
 
     def get_innovation(self, in_node, out_node):
         connection_key = (in_node, out_node)
@@ -309,6 +357,48 @@ class InnovationHistory:
             return self.innovation
 
 
+# Shared by every genome in the process
+innovation_history = InnovationHistory()
+
+
+class TickContext:
+    """Per-tick scratch space for sensor findings, read back by actuators.
+
+    Critters get a slot the first time something is recorded for them in a
+    tick, and each key is a column indexed by slot. clear() hands every slot
+    back at the end of the tick, so the store never outgrows the population and
+    never holds on to dead critters or eaten plants.
+    """
+
+    def __init__(self, keys):
+        self.columns = {key: [] for key in keys}
+        self.slots = {}
+
+    def clear(self):
+        used = len(self.slots)
+        for column in self.columns.values():
+            column[:used] = [None] * used
+        self.slots.clear()
+
+    def _slot(self, critter):
+        slot = self.slots.get(critter)
+        if slot is None:
+            slot = self.slots[critter] = len(self.slots)
+            if slot == len(self.columns["perception"]):
+                for column in self.columns.values():
+                    column.append(None)
+        return slot
+
+    def set(self, critter, key, data):
+        self.columns[key][self._slot(critter)] = data
+
+    def get(self, critter, key):
+        slot = self.slots.get(critter)
+        if slot is None:
+            return None
+        return self.columns[key][slot]
+
+
 class NeuronManager:
     # fmt: off
     sensors = {
@@ -350,17 +440,136 @@ class NeuronManager:
     }
     # fmt: on
 
-    def __init__(self, critters=None, plants=None):
-        self.critters = critters or []
-        self.plants = plants or []
-        self.context = {}
+    # Sensors that leave findings in the tick context, and the actuators that
+    # act on those findings, by kind of finding.
+    context_sensors = {
+        "neighbors": ("FDi", "SDi", "ODi", "ADi", "FAm", "AAm", "OAm", "CAm"),
+        "mouse": ("MsD",),
+    }
+    context_actuators = {
+        "neighbors": (
+            "Eat",
+            "MvS",
+            "MvO",
+            "MvA",
+            "MvF",
+            "AvS",
+            "AvO",
+            "AvA",
+            "AvF",
+            "SMS",
+        ),
+        "mouse": ("MvM", "AvM"),
+    }
+
+    # Sensors answered from the per-tick density tables
+    density_sensors = ("FAm", "AAm", "OAm", "CAm")
+
+    # Actuators that steer towards or away from something a sensor found: the
+    # context key of the target, and whether they move away from it. Batched
+    # by actuate() into one array pass each.
+    steering_actuators = {
+        "MvS": ("closest_same_critter", False),
+        "MvO": ("closest_other_critter", False),
+        "MvA": ("closest_any_critter", False),
+        "MvF": ("closest_food", False),
+        "MvM": ("mouse", False),
+        "AvS": ("closest_same_critter", True),
+        "AvO": ("closest_other_critter", True),
+        "AvA": ("closest_any_critter", True),
+        "AvF": ("closest_food", True),
+        "AvM": ("mouse", True),
+    }
+
+    # What sensors leave behind for actuators during a tick
+    context_keys = (
+        "perception",
+        "closest_same_critter",
+        "closest_other_critter",
+        "closest_any_critter",
+        "closest_food",
+        "mouse",
+    )
+
+    def __init__(
+        self,
+        critters=None,
+        plants=None,
+        world_size=None,
+        perception_slack=0,
+        perception_max_age=10,
+    ):
+        # Size of the wrapping environment; sensing is toroidal when given.
+        self.world_size = world_size
+        # A nonzero slack lets critters keep their neighbor candidates for up
+        # to `perception_max_age` ticks instead of querying every tick.
+        self.neighbor_search = spatial.NeighborSearch(
+            world_size=world_size,
+            coherence_slack=perception_slack,
+            coherence_ticks=perception_max_age,
+        )
+        self.context = TickContext(self.context_keys)
+        self.update(critters or [], plants or [])
+
+        # Keyed like the actuator calls of a genome: the order actuate() runs
+        # actuators in, and array versions of those that have one.
+        self.actuator_rank = {
+            self.get_actuator(name): rank for rank, name in enumerate(self.actuators)
+        }
+        self.batched_actuators = {self.get_actuator("Mv"): self._wander}
+        for name, (key, away) in self.steering_actuators.items():
+            self.batched_actuators[self.get_actuator(name)] = functools.partial(
+                self._steer, key=key, away=away
+            )
+
+    def get_sensor(self, name):
+        """Returns the function behind sensor `name`, to be called with a critter."""
+        if name not in self.sensors:
+            raise ValueError(f"Unknown sensor: {name}")
+        return getattr(self, f"obs_{name}")
+
+    def get_actuator(self, name):
+        """Returns the function behind actuator `name`, to be called with a critter."""
+        if name not in self.actuators:
+            raise ValueError(f"Unknown actuator: {name}")
+        return getattr(self, f"act_{name}")
 
     def update(self, critters, plants):
         self.critters = critters
         self.plants = plants
+        self.context.clear()
+        self.neighbor_search.update(critters, plants)
+        self.density_counts = None
+
+    def actuate(self, critters, action_masks):
+        """Carries out the actions of many critters of one store at once, one
+        actuator at a time in the order they are listed above: each actuator
+        runs once over all the critters that fired it, as looked up in their
+        genome's actuator calls. Movement runs as array passes over the store's
+        positions; everything else goes critter by critter. Critters struck
+        down during the tick take no further actions."""
+        chosen = defaultdict(list)
+        for critter, action_mask in zip(critters, action_masks):
+            calls = critter.genome.actuator_calls
+            for i in np.flatnonzero(action_mask).tolist():
+                chosen[calls[i]].append(critter)
+
+        for actuator in sorted(chosen, key=self.actuator_rank.__getitem__):
+            energy = chosen[actuator][0].store.energy
+            actors = [
+                critter for critter in chosen[actuator] if energy[critter.slot] > 0
+            ]
+            if not actors:
+                continue
+            batched = self.batched_actuators.get(actuator)
+            if batched is not None:
+                batched(actors)
+            else:
+                for critter in actors:
+                    actuator(critter)
 
-        self.critters_rect = [critter.rect for critter in self.critters]
-        self.plants_rect = [plant.rect for plant in self.plants]
+        for critter in critters:
+            critter.genome.fitness = critter.fitness
 
     # --- SENSOR FUNCTIONS ---
 
@@ -369,44 +578,19 @@ class NeuronManager:
 
     def obs_FDi(self, critter):
         """Returns normalized distance to the nearest food source, scaled to range -1 to 1."""
-        return self._get_normalized_nearest_distance(
-            critter=critter,
-            objects=self.plants,
-            context_key="closest_food",
-        )
+        return self._perceive(critter)["FDi"]
 
     def obs_SDi(self, critter):
         """Returns normalized distance to the nearest critter of the same species."""
-        return self._get_normalized_nearest_distance(
-            critter=critter,
-            objects=self.critters,
-            context_key="closest_same_critter",
-            filter_fn=(
-                lambda other: other.species == critter.species
-                and other.id != critter.id
-            ),
-        )
+        return self._perceive(critter)["SDi"]
 
     def obs_ODi(self, critter):
         """Returns normalized distance to the nearest critter of a different species."""
-        return self._get_normalized_nearest_distance(
-            critter=critter,
-            objects=self.critters,
-            context_key="closest_other_critter",
-            filter_fn=(
-                lambda other: other.species != critter.species
-                and other.id != critter.id
-            ),
-        )
+        return self._perceive(critter)["ODi"]
 
     def obs_ADi(self, critter):
         """Returns normalized distance to the nearest critter of any species."""
-        return self._get_normalized_nearest_distance(
-            critter=critter,
-            objects=self.critters,
-            context_key="closest_any_critter",
-            filter_fn=lambda other: other.id != critter.id,
-        )
+        return self._perceive(critter)["ADi"]
 
     def obs_MsD(self, critter):
         """Proximity to mouse pointer, if in visibility."""
@@ -418,12 +602,7 @@ class NeuronManager:
         mouse_rect = pygame.Rect(0, 0, 1, 1)
         mouse_rect.center = mouse_pos
 
-        self._update_context(
-            id=critter.id,
-            key="mouse",
-            time=critter.time,
-            data=mouse_rect,
-        )
+        self._update_context(critter, "mouse", mouse_rect)
 
         distance = helper.distance_between_points(critter.rect.center, mouse_rect)
         data = (distance / (critter.vision["radius"] * 2)) * 2 - 1
@@ -431,37 +610,19 @@ class NeuronManager:
 
     def obs_FAm(self, critter):
         """Returns normalized density of food sources in the critter's vision range."""
-        return self._get_normalized_density(
-            critter=critter,
-            objects=self.plants,
-            context_key="food_density",
-        )
+        return self._perceive(critter)["FAm"]
 
     def obs_AAm(self, critter):
         """Returns normalized density of same-species critters in the critter's vision range."""
-        return self._get_normalized_density(
-            critter=critter,
-            objects=self.critters,
-            context_key="same_critter_density",
-            filter_fn=lambda other: other.species == critter.species,
-        )
+        return self._perceive(critter)["AAm"]
 
     def obs_OAm(self, critter):
         """Returns normalized density of other-species critters in the critter's vision range."""
-        return self._get_normalized_density(
-            critter=critter,
-            objects=self.critters,
-            context_key="other_critter_density",
-            filter_fn=lambda other: other.species != critter.species,
-        )
+        return self._perceive(critter)["OAm"]
 
     def obs_CAm(self, critter):
         """Returns normalized density of any-species critters in the critter's vision range."""
-        return self._get_normalized_density(
-            critter=critter,
-            objects=self.critters,
-            context_key="any_critter_density",
-        )
+        return self._perceive(critter)["CAm"]
 
     def obs_CEn(self, critter):
         """Returns normalized energy level of the critter."""
@@ -473,8 +634,7 @@ class NeuronManager:
 
     def obs_CFi(self, critter):
         """Current fitness of the critter, compared to average."""
-        fitness_sum = sum(c.fitness for c in self.critters)
-        average_fitness = fitness_sum / len(self.critters)
+        average_fitness = critter.ledger.average_fitness()
         if average_fitness == 0:
             return 1.0
         else:
@@ -482,9 +642,9 @@ class NeuronManager:
 
     def obs_RSt(self, critter):
         """Reproduction state of the critter."""
-        if critter.mating_state == MatingState.NOT_READY:
+        if critter.mating_state in (MatingState.MINOR, MatingState.NOT_READY):
             return -1.0
-        elif critter.mating_state == MatingState.READY:
+        elif critter.mating_state in (MatingState.READY, MatingState.WAITING):
             return 0.0
         elif critter.mating_state == MatingState.MATING:
             return 1.0
@@ -516,90 +676,82 @@ class NeuronManager:
         # Gradually change the angle instead of jumping
         critter.angle += (target_angle - critter.angle) * 0.1  # Smooth transition
 
-        critter.rect.x += math.cos(critter.angle)
-        critter.rect.y += math.sin(critter.angle)
+        critter.move(math.cos(critter.angle), math.sin(critter.angle))
 
     def act_Eat(self, critter):
         """Eats the nearest food source if in range."""
-        if food := self._lookup_context(
-            id=critter.id, time=critter.time, key="closest_food"
-        ):
-            if critter.body_rect.colliderect(food.rect):
-                self.plants.remove(food)
-                critter.energy += 500
-                critter.fitness += 1
+        if food := self._lookup_context(critter, "closest_food"):
+            reach = critter.body_half_size + food.half_size
+            if spatial.squares_overlap(
+                critter.position, food.position, reach, self.world_size
+            ):
+                # Another critter may have eaten it since this one looked.
+                if self.neighbor_search.remove(food):
+                    self.plants.remove(food)
+                    critter.energy += 500
+                    critter.fitness += 1
             else:
-                new_x, new_y = self._get_movement_step(critter, food, pull=True)
-                food.rect.x, food.rect.y = new_x, new_y
+                dx, dy = self._get_movement_step(critter, food, pull=True)
+                food.rect.x, food.rect.y = food.rect.x + dx, food.rect.y + dy
 
     def act_MvS(self, critter):
         """Moves towards the nearest same-species critter, if found."""
-        if other := self._lookup_context(
-            id=critter.id, time=critter.time, key="closest_same_critter"
-        ):
-            if other.rect.center != critter.rect.center:
-                new_x, new_y = self._get_movement_step(critter, other)
-                critter.rect.x, critter.rect.y = new_x, new_y
+        if other := self._lookup_context(critter, "closest_same_critter"):
+            if other.position != critter.position:
+                critter.move(*self._get_movement_step(critter, other))
 
     def act_MvO(self, critter):
         """Moves towards the nearest other-species critter, if found."""
-        if other := self._lookup_context(
-            id=critter.id, time=critter.time, key="closest_other_critter"
-        ):
-            if other.rect.center != critter.rect.center:
-                new_x, new_y = self._get_movement_step(critter, other)
-                critter.rect.x, critter.rect.y = new_x, new_y
+        if other := self._lookup_context(critter, "closest_other_critter"):
+            if other.position != critter.position:
+                critter.move(*self._get_movement_step(critter, other))
 
     def act_MvA(self, critter):
         """Moves towards the nearest any-species critter, if found."""
-        if other := self._lookup_context(
-            id=critter.id, time=critter.time, key="closest_any_critter"
-        ):
-            if other.rect.center != critter.rect.center:
-                new_x, new_y = self._get_movement_step(critter, other)
-                critter.rect.x, critter.rect.y = new_x, new_y
+        if other := self._lookup_context(critter, "closest_any_critter"):
+            if other.position != critter.position:
+                critter.move(*self._get_movement_step(critter, other))
 
     def act_MvF(self, critter):
         """Moves towards the nearest food source, if found."""
-        if food := self._lookup_context(
-            id=critter.id, time=critter.time, key="closest_food"
-        ):
-            if food.rect.center != critter.rect.center:
-                new_x, new_y = self._get_movement_step(critter, food)
-                critter.rect.x, critter.rect.y = new_x, new_y
+        if food := self._lookup_context(critter, "closest_food"):
+            if food.position != critter.position:
+                critter.move(*self._get_movement_step(critter, food))
 
     def act_MvM(self, critter):
         """Moves towards the mouse pointer, if found."""
-        if mouse_rect := self._lookup_context(
-            id=critter.id, time=critter.time, key="mouse"
-        ):
-            if mouse_rect != critter.rect.center:
-                new_x, new_y = self._get_movement_step(critter, mouse_rect)
-                critter.rect.x, critter.rect.y = new_x, new_y
+        if mouse_rect := self._lookup_context(critter, "mouse"):
+            if mouse_rect != critter.position:
+                critter.move(*self._get_movement_step(critter, mouse_rect))
 
     def act_ADe(self, critter):
         """Activates defense mechanism when triggered, deactivates otherwise."""
         critter.defense_active = True
         if critter.defense_mechanism == Defence.SWORDLING:
-            collision_indices = critter.interaction_rect.collidelistall(
-                [other.interaction_rect for other in self.critters]
-            )
-            if collision_indices:
-                for i in collision_indices:
-                    other = self.critters[i]
-                    if other.id == critter.id:
-                        continue
-                    elif other.defense_active and (
-                        other.defense_mechanism
-                        in [
-                            Defence.SHIELDLING,
-                            Defence.CAMOUFLING,
-                        ]
-                    ):
-                        continue
-                    else:
-                        other.energy = 0
-                        critter.fitness += 1
+            # Strikes land on critters whose body squares overlap this one's.
+            half_size = critter.body_half_size
+            nearby = self.neighbor_search.critters_near(critter.position, half_size)
+            for other in nearby:
+                if other.id == critter.id:
+                    continue
+                elif not spatial.squares_overlap(
+                    critter.position,
+                    other.position,
+                    half_size + other.body_half_size,
+                    self.world_size,
+                ):
+                    continue
+                elif other.defense_active and (
+                    other.defense_mechanism
+                    in [
+                        Defence.SHIELDLING,
+                        Defence.CAMOUFLING,
+                    ]
+                ):
+                    continue
+                else:
+                    other.energy = 0
+                    critter.fitness += 1
 
     def act_DDe(self, critter):
         """Deactivates defense mechanism when triggered."""
@@ -607,54 +759,37 @@ class NeuronManager:
 
     def act_AvS(self, critter):
         """Move away from the nearest same-species critter, if found."""
-        if other := self._lookup_context(
-            id=critter.id, time=critter.time, key="closest_same_critter"
-        ):
-            if other.rect.center != critter.rect.center:
-                new_x, new_y = self._get_avoidance_step(critter, other)
-                critter.rect.x, critter.rect.y = new_x, new_y
+        if other := self._lookup_context(critter, "closest_same_critter"):
+            if other.position != critter.position:
+                critter.move(*self._get_avoidance_step(critter, other))
 
     def act_AvO(self, critter):
         """Move away from the nearest other-species critter, if found."""
-        if other := self._lookup_context(
-            id=critter.id, time=critter.time, key="closest_other_critter"
-        ):
-            if other.rect.center != critter.rect.center:
-                new_x, new_y = self._get_avoidance_step(critter, other)
-                critter.rect.x, critter.rect.y = new_x, new_y
+        if other := self._lookup_context(critter, "closest_other_critter"):
+            if other.position != critter.position:
+                critter.move(*self._get_avoidance_step(critter, other))
 
     def act_AvA(self, critter):
         """Move away from the nearest any-species critter, if found."""
-        if other := self._lookup_context(
-            id=critter.id, time=critter.time, key="closest_any_critter"
-        ):
-            if other.rect.center != critter.rect.center:
-                new_x, new_y = self._get_avoidance_step(critter, other)
-                critter.rect.x, critter.rect.y = new_x, new_y
+        if other := self._lookup_context(critter, "closest_any_critter"):
+            if other.position != critter.position:
+                critter.move(*self._get_avoidance_step(critter, other))
 
     def act_AvF(self, critter):
         """Move away from the nearest food source, if found."""
-        if food := self._lookup_context(
-            id=critter.id, time=critter.time, key="closest_food"
-        ):
-            if food.rect.center != critter.rect.center:
-                new_x, new_y = self._get_avoidance_step(critter, food)
-                critter.rect.x, critter.rect.y = new_x, new_y
+        if food := self._lookup_context(critter, "closest_food"):
+            if food.position != critter.position:
+                critter.move(*self._get_avoidance_step(critter, food))
 
     def act_AvM(self, critter):
         """Move away from the mouse pointer, if found."""
-        if mouse_rect := self._lookup_context(
-            id=critter.id, time=critter.time, key="mouse"
-        ):
-            if mouse_rect != critter.rect.center:
-                new_x, new_y = self._get_avoidance_step(critter, mouse_rect)
-                critter.rect.x, critter.rect.y = new_x, new_y
+        if mouse_rect := self._lookup_context(critter, "mouse"):
+            if mouse_rect != critter.position:
+                critter.move(*self._get_avoidance_step(critter, mouse_rect))
 
     def act_SMS(self, critter):
         """Send a mating signal to a nearby critter, of the same species"""
-        if other := self._lookup_context(
-            id=critter.id, time=critter.time, key="closest_same_critter"
-        ):
+        if other := self._lookup_context(critter, "closest_same_critter"):
             if (
                 other.mating_state == MatingState.READY
                 and critter.mating_state == MatingState.READY
@@ -669,136 +804,184 @@ class NeuronManager:
             critter.remove_mate()
             critter.fitness += 1
 
-    # --- HELPER FUNCTIONS ---
-    def _get_normalized_nearest_distance(
-        self, critter, objects, context_key, filter_fn=None
-    ):
-        """Returns normalized distance to the nearest object in 'objects', scaled to [-1, 1].
-        Optionally filters objects using 'filter_fn'.
-        """
-        colliding_indices = critter.rect.collidelistall([obj.rect for obj in objects])
-
-        if not colliding_indices or (
-            len(colliding_indices) == 1
-            and getattr(objects[colliding_indices[0]], "id", None) == critter.id
-        ):
-            return 1.0
-
-        filtered_objects = [
-            objects[i]
-            for i in colliding_indices
-            if not filter_fn or filter_fn(objects[i])
-        ]
-
-        if not filtered_objects:
-            return 1.0
-
-        closest_obj = min(
-            filtered_objects,
-            key=lambda obj: helper.distance_between_points(
-                critter.rect.center, obj.rect.center
+    # --- BATCHED ACTUATORS ---
+
+    def _wander(self, critters):
+        """act_Mv for many critters at once."""
+        store = critters[0].store
+        slots = np.fromiter((critter.slot for critter in critters), np.intp)
+        directions = np.fromiter(
+            (
+                noise.snoise2(((seed + age) / 1000) % 1000, 0)
+                for seed, age in zip(
+                    [critter.seed for critter in critters], store.age[slots].tolist()
+                )
             ),
+            float,
+            len(critters),
         )
 
-        self._update_context(
-            id=critter.id,
-            key=context_key,
-            time=critter.time,
-            data=closest_obj,
-        )
+        # Gradually change the angle instead of jumping
+        angles = store.angle[slots]
+        angles += ((directions + 1) * math.pi - angles) * 0.1
+        store.angle[slots] = angles
+        np.add.at(store.x, slots, np.cos(angles))
+        np.add.at(store.y, slots, np.sin(angles))
+
+    def _steer(self, critters, key, away):
+        """act_MvS and the like for many critters at once: moves each critter a
+        unit step towards, or with `away` away from, the target its sensors
+        found under `key`. Critters closer than a unit step stay put when
+        approaching and step off in a random direction when avoiding, unless
+        they sit right on the target."""
+        movers, centers = [], []
+        for critter in critters:
+            if target := self._lookup_context(critter, key):
+                movers.append(critter)
+                centers.append(self._get_center(target))
+        if not movers:
+            return
+
+        store = movers[0].store
+        slots = np.fromiter((critter.slot for critter in movers), np.intp)
+        centers = np.array(centers, dtype=float)
+        width, height = self.world_size or (None, None)
+        dx = spatial.wrapped_delta(store.x[slots], centers[:, 0], width)
+        dy = spatial.wrapped_delta(store.y[slots], centers[:, 1], height)
+        if away:
+            dx, dy = -dx, -dy
+
+        distance = np.hypot(dx, dy)
+        far = distance >= 1
+        steps_x = np.where(far, dx / np.where(far, distance, 1), 0.0)
+        steps_y = np.where(far, dy / np.where(far, distance, 1), 0.0)
+        if away:
+            near = (distance > 0) & ~far
+            angles = np.random.uniform(0, 2 * math.pi, np.count_nonzero(near))
+            steps_x[near] = np.cos(angles)
+            steps_y[near] = np.sin(angles)
+
+        np.add.at(store.x, slots, steps_x)
+        np.add.at(store.y, slots, steps_y)
 
-        min_distance = helper.distance_between_points(
-            critter.rect.center, closest_obj.rect.center
+    # --- HELPER FUNCTIONS ---
+    def _perceive(self, critter):
+        """Scans the critter's neighborhood once and derives every proximity sensor
+        from it. Readings are cached in the context for the rest of the tick.
+        """
+        if perception := self._lookup_context(critter, "perception"):
+            return perception
+
+        nearest = self.neighbor_search.scan(critter)
+        nearest["closest_any_critter"] = min(
+            nearest["closest_same_critter"],
+            nearest["closest_other_critter"],
+            key=lambda entry: entry[1],
         )
 
-        # Normalize to [-1, 1]
-        return (min(min_distance / (critter.rect.width // 2), 1) * 2) - 1
+        for key, (obj, _) in nearest.items():
+            if obj is not None:
+                self._update_context(critter, key, obj)
 
-    def _get_normalized_density(self, critter, objects, context_key, filter_fn=None):
-        """Returns normalized density of objects in 'objects' within critter's vision range."""
-        colliding_indices = critter.rect.collidelistall([obj.rect for obj in objects])
+        perception = {
+            "FDi": self._normalize_distance(critter, nearest["closest_food"][1]),
+            "SDi": self._normalize_distance(
+                critter, nearest["closest_same_critter"][1]
+            ),
+            "ODi": self._normalize_distance(
+                critter, nearest["closest_other_critter"][1]
+            ),
+            "ADi": self._normalize_distance(critter, nearest["closest_any_critter"][1]),
+        }
+        if critter.genome.reads_density:
+            same, other, food = self._count_densities(critter)
+            perception["FAm"] = self._normalize_density(food)
+            perception["AAm"] = self._normalize_density(same)
+            perception["OAm"] = self._normalize_density(other)
+            perception["CAm"] = self._normalize_density(same + other)
+        self._update_context(critter, "perception", perception)
+        return perception
+
+    def _count_densities(self, critter):
+        """Same-species, other-species and plant counts around the critter. The
+        first call in a tick counts for every critter whose genome reads a
+        density sensor at once."""
+        if self.density_counts is None:
+            readers = [c for c in self.critters if c.genome.reads_density]
+            counts = self.neighbor_search.densities(readers)
+            self.density_counts = dict(
+                zip(readers, zip(*(column.tolist() for column in counts)))
+            )
 
-        if not colliding_indices:
-            return -1.0
+        counts = self.density_counts.get(critter)
+        if counts is None:  # Not in this tick's population, such as a newborn
+            same, other, food = self.neighbor_search.densities([critter])
+            counts = (int(same[0]), int(other[0]), int(food[0]))
+        return counts
 
-        filtered_objects = [
-            objects[i]
-            for i in colliding_indices
-            if not filter_fn or filter_fn(objects[i])
-        ]
+    def _normalize_distance(self, critter, distance):
+        """Scales a distance within the critter's vision to [-1, 1]; 1 if nothing seen."""
+        if distance == math.inf:
+            return 1.0
+        return (min(distance / critter.half_size, 1) * 2) - 1
 
-        if not filtered_objects:
+    def _normalize_density(self, count):
+        """Scales an object count to [-1, 1], saturating at 10."""
+        if not count:
             return -1.0
-
-        self._update_context(
-            id=critter.id,
-            key=context_key,
-            time=critter.time,
-            data=len(filtered_objects),
-        )
-
-        # Normalize to [-1, 1]
-        return (min(len(filtered_objects) / 10, 1) * 2) - 1
+        return (min(count / 10, 1) * 2) - 1
 
     def _get_movement_step(self, mover, target, step_size=1, pull=False):
-        target_rect = target if isinstance(target, pygame.Rect) else target.rect
-        dx = target_rect.centerx - mover.rect.centerx
-        dy = target_rect.centery - mover.rect.centery
+        """Step (dx, dy) that takes `mover` towards `target`, or with `pull`,
+        the step that draws `target` towards `mover` instead."""
+        dx, dy = self._get_offset(mover.position, self._get_center(target))
 
         distance_sq = dx * dx + dy * dy
 
         if distance_sq < 1:  # If very close, don't move
-            return mover.rect.x, mover.rect.y
+            return 0, 0
 
         distance = math.sqrt(distance_sq)
         unit_vector = (dx / distance, dy / distance)
 
-        step = max(0.2, 1 - (distance / (mover.rect.width))) if pull else step_size
-
-        new_x = (
-            target_rect.x - step * unit_vector[0]
-            if pull
-            else mover.rect.x + step * unit_vector[0]
-        )
-        new_y = (
-            target_rect.y - step * unit_vector[1]
-            if pull
-            else mover.rect.y + step * unit_vector[1]
-        )
-
-        return new_x, new_y
+        if pull:
+            step = max(0.2, 1 - (distance / (2 * mover.half_size)))
+            return -step * unit_vector[0], -step * unit_vector[1]
+        return step_size * unit_vector[0], step_size * unit_vector[1]
 
     def _get_avoidance_step(self, mover, target, step_size=1):
-        target_rect = target if isinstance(target, pygame.Rect) else target.rect
-        dx = mover.rect.centerx - target_rect.centerx
-        dy = mover.rect.centery - target_rect.centery
+        """Step (dx, dy) that takes `mover` away from `target`."""
+        dx, dy = self._get_offset(self._get_center(target), mover.position)
 
         distance_sq = dx * dx + dy * dy
 
         if distance_sq < 1:  # If very close, move in a random direction
             angle = random.uniform(0, 2 * math.pi)
-            return mover.rect.x + step_size * math.cos(
-                angle
-            ), mover.rect.y + step_size * math.sin(angle)
+            return step_size * math.cos(angle), step_size * math.sin(angle)
 
         distance = math.sqrt(distance_sq)
         unit_vector = (dx / distance, dy / distance)  # Flip direction to move away
 
-        new_x = mover.rect.x + step_size * unit_vector[0]
-        new_y = mover.rect.y + step_size * unit_vector[1]
+        return step_size * unit_vector[0], step_size * unit_vector[1]
+
+    def _get_center(self, target):
+        """Center of a sensed target: a critter or plant, or the mouse rect."""
+        if isinstance(target, pygame.Rect):
+            return target.center
+        return target.position
 
-        return new_x, new_y
+    def _get_offset(self, origin, point):
+        """Shortest (dx, dy) from 'origin' to 'point', across the world's edges."""
+        width, height = self.world_size or (None, None)
+        return (
+            spatial.wrapped_delta(origin[0], point[0], width),
+            spatial.wrapped_delta(origin[1], point[1], height),
+        )
 
-    def _update_context(self, id, key, time, data):
-        """Helper function to update self.context without overwriting existing data."""
-        if id not in self.context:
-            self.context[id] = {}
-        self.context[id].update({key: {"time": time, "data": data}})
+    def _update_context(self, critter, key, data):
+        """Records what the critter's sensors found, until the end of the tick."""
+        self.context.set(critter, key, data)
 
-    def _lookup_context(self, id, time, key):
-        """lookup and return data from context"""
-        instance = self.context.get(id, {}).get(key)
-        if instance is not None:
-            if instance["time"] == time:
-                return instance["data"]
-        return None
+    def _lookup_context(self, critter, key):
+        """Returns what the critter's sensors found this tick, if anything."""
+        return self.context.get(critter, key)
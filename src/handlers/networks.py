@@ -0,0 +1,481 @@
+import copy
+import itertools
+import weakref
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from src import helper
+from src.config import ACTION_MEMO_QUANTUM, ACTION_MEMO_SIZE
+from src.enums import NeuronType
+
+# Topologies shared by fewer networks than this are packed together instead.
+MIN_GROUP_SIZE = 4
+
+# Compiled networks by genome structure, shared by all genomes built alike,
+# and topologies by structure. Both go once no genome's network uses them.
+_compiled = weakref.WeakValueDictionary()
+_topologies = weakref.WeakValueDictionary()
+
+
+class Topology:
+    """Identity of a network structure. Networks with the same structure hold
+    the same Topology, which groups cheaply by identity each tick."""
+
+    __slots__ = ("__weakref__",)
+
+
+def compile_genome(genome):
+    """Returns the compiled network for `genome`.
+
+    Genomes with the same structure, which is what crossover produces, share
+    one compiled network: only the first of them is actually compiled. A
+    genome whose weights differ from the shared ones gets a copy that owns
+    its weights and matrix and shares everything else.
+    """
+    nodes = list(genome.node_genes.values())
+    connections = list(genome.connection_genes.values())
+    position = {node._id: i for i, node in enumerate(nodes)}
+    structure = (
+        tuple((node.type, node.name) for node in nodes),
+        tuple(
+            (position[conn.in_node._id], position[conn.out_node._id], conn.enabled)
+            for conn in connections
+        ),
+    )
+
+    network = _compiled.get(structure)
+    if network is None:
+        network = CompiledNetwork(genome)
+        _compiled[structure] = network
+    return network.with_weights(np.array([conn.weight for conn in connections]))
+
+
+class CompiledNetwork:
+    """A genome's graph flattened into arrays for evaluation.
+
+    Nodes that cannot reach an actuator are pruned. The rest get integer
+    indices in topological order: sensors first, in the order their values
+    are observed, then bias nodes, then every other node
+    after all the nodes that feed it. Nodes at the same depth form a layer and
+    sit next to each other, so a forward pass is one matrix product per layer.
+    Enabled connections are kept as parallel `sources`, `targets` and `weights`
+    arrays, from which the dense `matrix` is filled.
+
+    Two genomes with the same `topology` differ at most in their
+    weights, and can be evaluated side by side as rows of one batch (see
+    forward_batch).
+    """
+
+    def __init__(self, genome):
+        # Sensors and bias nodes hold their values, so edges into them are inert.
+        connections = [
+            conn
+            for conn in genome.connection_genes.values()
+            if conn.enabled
+            and conn.out_node.type not in (NeuronType.SENSOR, NeuronType.BIAS)
+        ]
+        live = self._live_nodes(genome, connections)
+        connections = [conn for conn in connections if conn.out_node._id in live]
+
+        # Only sensors with a path to an actuator are read; `sensor_slots` says
+        # which of the genome's sensors those are, in input order.
+        self.sensor_slots = [
+            i for i, node in enumerate(genome.sensors) if node._id in live
+        ]
+        sensors = [genome.sensors[i] for i in self.sensor_slots]
+        bias = [node for node in genome.bias if node._id in live]
+        inputs = sensors + bias
+        self.input_count = len(sensors)
+        self.bias_count = len(bias)
+
+        input_ids = {node._id for node in inputs}
+        nodes = [
+            node
+            for node in genome.node_genes.values()
+            if node._id in live and node._id not in input_ids
+        ]
+        depth = self._depths(inputs, nodes, connections)
+
+        ordered = inputs + sorted(nodes, key=lambda node: depth[node._id])
+        # Node ids differ from genome to genome, so they stay out of the
+        # compiled form; everything past this point works by index.
+        node_ids = [node._id for node in ordered]
+        index_of = {node_id: i for i, node_id in enumerate(node_ids)}
+        self.size = len(ordered)
+
+        self.layers = []
+        start = len(inputs)
+        for i in range(start + 1, self.size + 1):
+            if i == self.size or depth[node_ids[i]] != depth[node_ids[start]]:
+                self.layers.append((start, i))
+                start = i
+
+        # Edges sorted by target, so each layer's incoming edges are a slice.
+        # `weight_slots` says which connection gene weights each edge.
+        slot_of = {
+            id(conn): slot for slot, conn in enumerate(genome.connection_genes.values())
+        }
+        connections.sort(key=lambda conn: index_of[conn.out_node._id])
+        self.weight_slots = np.array(
+            [slot_of[id(conn)] for conn in connections], dtype=np.intp
+        )
+        self.sources = np.array(
+            [index_of[conn.in_node._id] for conn in connections], dtype=np.intp
+        )
+        self.targets = np.array(
+            [index_of[conn.out_node._id] for conn in connections], dtype=np.intp
+        )
+        self.weights = np.array([conn.weight for conn in connections], dtype=float)
+
+        self.matrix = np.zeros((self.size, self.size))
+        self.matrix[self.targets, self.sources] = self.weights
+
+        # Per layer, a one-hot (edges, nodes) matrix summing edge inputs per node.
+        self.layer_edges = []
+        self.edge_layers = np.zeros(len(connections), dtype=np.intp)
+        for layer, (start, end) in enumerate(self.layers):
+            first, last = np.searchsorted(self.targets, (start, end))
+            scatter = np.zeros((last - first, end - start))
+            scatter[np.arange(last - first), self.targets[first:last] - start] = 1.0
+            self.layer_edges.append((first, last, scatter))
+            self.edge_layers[first:last] = layer
+
+        self._compile_winners(genome, index_of)
+        structure = (
+            tuple((node.type, node.name) for node in ordered),
+            self.sources.tobytes(),
+            self.targets.tobytes(),
+            self.actuator_group.tobytes(),
+        )
+        self.topology = _topologies.get(structure)
+        if self.topology is None:
+            self.topology = _topologies[structure] = Topology()
+        # The network this one was reweighted from, kept alive for the cache
+        self.base = None
+        self.memo = ActionMemo(ACTION_MEMO_SIZE) if ACTION_MEMO_SIZE else None
+
+    def _connected_groups(self, genome):
+        """Node ids of each connected component, counting disabled connections."""
+        undirected_map = {node_id: set() for node_id in genome.node_genes}
+        for node_1, node_2 in genome.connection_genes:
+            undirected_map[node_1].add(node_2)
+            undirected_map[node_2].add(node_1)
+
+        visited = set()
+        components = []
+        for node in undirected_map:
+            if node not in visited:
+                group = []
+                helper.dfs(undirected_map, node, visited, group)
+                components.append(group)
+        return components
+
+    def _compile_winners(self, genome, index_of):
+        """Lays the actuators out group by group for winner-takes-all."""
+        group_of = {}
+        for group, node_ids in enumerate(self._connected_groups(genome)):
+            for node_id in node_ids:
+                group_of[node_id] = group
+
+        self.actuator_index = np.array(
+            [index_of[node._id] for node in genome.actuators], dtype=np.intp
+        )
+        self.actuator_group = np.array(
+            [group_of[node._id] for node in genome.actuators], dtype=np.intp
+        )
+        # Column order that puts each group's actuators next to each other,
+        # with where each run starts and how long it is.
+        self.winner_order = np.argsort(self.actuator_group, kind="stable")
+        _, self.winner_starts, self.winner_sizes = np.unique(
+            self.actuator_group[self.winner_order],
+            return_index=True,
+            return_counts=True,
+        )
+        self.winner_actuators = self.actuator_index[self.winner_order]
+
+    def with_weights(self, gene_weights):
+        """This network weighted by `gene_weights`, one per connection gene in
+        gene order. Returns the network itself when the weights match, and
+        otherwise a copy that owns its weights but shares the structure."""
+        weights = gene_weights[self.weight_slots]
+        if np.array_equal(weights, self.weights):
+            return self
+
+        network = copy.copy(self)
+        network.base = self.base or self
+        network.weights = weights
+        network.matrix = np.zeros_like(self.matrix)
+        network.matrix[self.targets, self.sources] = weights
+        if self.memo is not None:
+            network.memo = ActionMemo(self.memo.size)
+        return network
+
+    def _live_nodes(self, genome, connections):
+        """Ids of the actuators and of every node with a path to one. Anything
+        else cannot change an action, so it is pruned from the network."""
+        feeding = defaultdict(list)
+        for conn in connections:
+            feeding[conn.out_node._id].append(conn.in_node._id)
+
+        live = {node._id for node in genome.actuators}
+        pending = list(live)
+        while pending:
+            for node_id in feeding[pending.pop()]:
+                if node_id not in live:
+                    live.add(node_id)
+                    pending.append(node_id)
+        return live
+
+    def _depths(self, inputs, nodes, connections):
+        """Longest path from the inputs to each node, by Kahn's algorithm. Nodes
+        on a cycle get a layer of their own after everything else and read the
+        nodes that come later as 0, like an unevaluated activation."""
+        depth = {node._id: 0 for node in inputs}
+        waiting = {node._id: 0 for node in nodes}
+        outgoing = {node_id: [] for node_id in depth | waiting}
+        for conn in connections:
+            outgoing[conn.in_node._id].append(conn.out_node._id)
+            waiting[conn.out_node._id] += 1
+
+        ready = list(depth)
+        for node in nodes:
+            if not waiting[node._id]:
+                depth[node._id] = 1
+                ready.append(node._id)
+
+        while ready:
+            node_id = ready.pop()
+            for target in outgoing[node_id]:
+                depth[target] = max(depth.get(target, 1), depth[node_id] + 1)
+                waiting[target] -= 1
+                if waiting[target] == 0:
+                    ready.append(target)
+
+        last = max(depth.values(), default=0)
+        for node in nodes:
+            if waiting[node._id] > 0:
+                last += 1
+                depth[node._id] = last
+        return depth
+
+    def forward(self, inputs):
+        """Returns the pre-activation value of every node, by index."""
+        values = np.zeros(self.size)
+        values[: self.input_count] = inputs
+        values[self.input_count : self.input_count + self.bias_count] = 1.0
+        for start, end in self.layers:
+            values[start:end] = self.matrix[start:end] @ values
+        return values
+
+    def propagate(self, values, weights):
+        """Fills in every computed node of a (batch, nodes) array whose input
+        and bias columns are set, with one row of edge `weights` per row."""
+        for (start, end), (first, last, scatter) in zip(self.layers, self.layer_edges):
+            incoming = values[:, self.sources[first:last]] * weights[:, first:last]
+            values[:, start:end] = incoming @ scatter
+        return values
+
+    def winners(self, values):
+        """Winner-takes-all over (batch, nodes) values: in each group the
+        actuators holding the highest value fire, unless it is negative.
+        Returns a (batch, actuators) boolean mask in actuator order."""
+        fired = np.zeros((len(values), len(self.actuator_index)), dtype=bool)
+        if not len(self.actuator_index):
+            return fired
+
+        outputs = values[:, self.actuator_index[self.winner_order]]
+        best = np.maximum.reduceat(outputs, self.winner_starts, axis=1)
+        best = np.repeat(best, self.winner_sizes, axis=1)
+        fired[:, self.winner_order] = (outputs == best) & (best >= 0)
+        return fired
+
+
+class ActionMemo:
+    """The action masks a network has computed, by input vector, for the
+    `size` most recently used input vectors. `hits` and `misses` count the
+    lookups, as a measure of how much inference it saves.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.masks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        mask = self.masks.get(key)
+        if mask is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.masks.move_to_end(key)
+        return mask
+
+    def put(self, key, mask):
+        self.masks[key] = mask
+        if len(self.masks) > self.size:
+            self.masks.popitem(last=False)
+
+
+def _concat(arrays, dtype=np.intp):
+    """np.concatenate that also accepts an empty list."""
+    return np.concatenate(arrays) if arrays else np.zeros(0, dtype)
+
+
+def _ranges(starts, counts):
+    """Concatenates range(start, start + count) over paired starts and counts."""
+    ends = np.cumsum(counts)
+    total = int(ends[-1]) if len(ends) else 0
+    return np.arange(total) + np.repeat(starts - (ends - counts), counts)
+
+
+class PackedNetworks:
+    """Differently shaped networks laid side by side as one block-diagonal graph.
+
+    Node indices of each network are shifted past those of the networks before
+    it, and all the edges are pooled into flat arrays sorted by layer, so the
+    pooled edges of a layer form a sparse matrix in coordinate form. Layer k
+    of every network is computed by the same gather-and-sum, whatever the
+    networks look like, and winner-takes-all runs over all actuator groups at
+    once.
+    """
+
+    def __init__(self, networks):
+        sizes = np.array([network.size for network in networks], dtype=np.intp)
+        offsets = np.cumsum(sizes) - sizes
+        self.size = int(sizes.sum())
+
+        edge_counts = [len(network.weights) for network in networks]
+        edge_layers = _concat([network.edge_layers for network in networks])
+        order = np.argsort(edge_layers, kind="stable")
+        shift = np.repeat(offsets, edge_counts)
+        self.sources = (_concat([net.sources for net in networks]) + shift)[order]
+        self.targets = (_concat([net.targets for net in networks]) + shift)[order]
+        self.weights = _concat([net.weights for net in networks], float)[order]
+        layer_count = max((len(network.layers) for network in networks), default=0)
+        self.layer_bounds = np.searchsorted(
+            edge_layers[order], np.arange(layer_count + 1)
+        )
+
+        input_counts = np.array([net.input_count for net in networks], dtype=np.intp)
+        bias_counts = np.array([net.bias_count for net in networks], dtype=np.intp)
+        self.input_positions = _ranges(offsets, input_counts)
+        self.bias_positions = _ranges(offsets + input_counts, bias_counts)
+
+        # Actuators group by group, as each network lays them out on its own.
+        counts = np.array([len(net.actuator_index) for net in networks], np.intp)
+        actuator_offsets = np.cumsum(counts) - counts
+        group_counts = [len(network.winner_starts) for network in networks]
+        self.actuator_positions = _concat(
+            [network.winner_actuators for network in networks]
+        ) + np.repeat(offsets, counts)
+        self.winner_order = _concat(
+            [network.winner_order for network in networks]
+        ) + np.repeat(actuator_offsets, counts)
+        self.winner_starts = _concat(
+            [network.winner_starts for network in networks]
+        ) + np.repeat(actuator_offsets, group_counts)
+        self.winner_sizes = _concat([network.winner_sizes for network in networks])
+        self.splits = np.cumsum(counts)[:-1]
+
+    def forward(self, inputs):
+        """Evaluates every network on its row of `inputs` and returns their
+        actuator masks, in the order the networks were packed."""
+        values = np.zeros(self.size)
+        values[self.input_positions] = [value for row in inputs for value in row]
+        values[self.bias_positions] = 1.0
+
+        bounds = self.layer_bounds
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            incoming = values[self.sources[first:last]] * self.weights[first:last]
+            values += np.bincount(
+                self.targets[first:last], incoming, minlength=self.size
+            )
+
+        fired = np.zeros(len(self.actuator_positions), dtype=bool)
+        if len(fired):
+            outputs = values[self.actuator_positions]
+            best = np.maximum.reduceat(outputs, self.winner_starts)
+            best = np.repeat(best, self.winner_sizes)
+            fired[self.winner_order] = (outputs == best) & (best >= 0)
+        return np.split(fired, self.splits)
+
+
+def forward_batch(networks, inputs):
+    """Evaluates many networks on their rows of `inputs` in a few array passes.
+
+    With ACTION_MEMO_SIZE set, inputs are first rounded to multiples of
+    ACTION_MEMO_QUANTUM, and networks that have seen their input vector lately
+    reuse the mask they computed for it; only the rest are evaluated.
+
+    Networks are grouped by topology, and every group of at least
+    MIN_GROUP_SIZE runs as one batch. When all of a group shares the same
+    weights, which is the norm within a species, each layer is a single
+    product with the shared matrix; otherwise the members' edge weights are
+    stacked row by row. Whatever is left, such as mutants with one-off
+    topologies, is packed into one block-diagonal pass. Returns each
+    network's actuator mask, in the order the networks were given.
+    """
+    masks = [None] * len(networks)
+    pending = range(len(networks))
+    if ACTION_MEMO_SIZE:
+        inputs, keys = _recall(networks, inputs, masks)
+        pending = [i for i in pending if masks[i] is None]
+
+    groups = defaultdict(list)
+    for i in pending:
+        groups[networks[i].topology].append(i)
+
+    stragglers = []
+    for members in groups.values():
+        if len(members) < MIN_GROUP_SIZE:
+            stragglers.extend(members)
+            continue
+
+        network = networks[members[0]]
+        values = np.zeros((len(members), network.size))
+        values[:, : network.input_count] = [inputs[i] for i in members]
+        values[:, network.input_count : network.input_count + network.bias_count] = 1.0
+
+        weights = np.stack([networks[i].weights for i in members])
+        if (weights == network.weights).all():
+            for start, end in network.layers:
+                values[:, start:end] = values @ network.matrix[start:end].T
+        else:
+            network.propagate(values, weights)
+
+        for i, mask in zip(members, network.winners(values)):
+            masks[i] = mask
+
+    if stragglers:
+        packed = PackedNetworks([networks[i] for i in stragglers])
+        for i, mask in zip(stragglers, packed.forward([inputs[i] for i in stragglers])):
+            masks[i] = mask
+
+    if ACTION_MEMO_SIZE:
+        for i in pending:
+            networks[i].memo.put(keys[i], masks[i])
+    return masks
+
+
+def _recall(networks, inputs, masks):
+    """Rounds every row of `inputs` for the memos and fills in the masks the
+    memos already hold. Returns the rounded rows and their memo keys."""
+    counts = [len(row) for row in inputs]
+    ends = np.cumsum(counts).tolist()
+    total = ends[-1] if ends else 0
+    values = np.fromiter(itertools.chain.from_iterable(inputs), float, total)
+    if ACTION_MEMO_QUANTUM:
+        values = np.round(values / ACTION_MEMO_QUANTUM) * ACTION_MEMO_QUANTUM
+    values += 0.0  # -0.0 and 0.0 share a key
+
+    raw = values.tobytes()
+    rows, keys = [], []
+    for i, (network, end, count) in enumerate(zip(networks, ends, counts)):
+        start = end - count
+        key = raw[start * values.itemsize : end * values.itemsize]
+        rows.append(values[start:end])
+        keys.append(key)
+        masks[i] = network.memo.get(key)
+    return rows, keys
@@ -11,6 +11,7 @@ from src import helper
 import src.agents as agents
 from src.config import Colors, Fonts
 from src.enums import Attributes, MatingState, SurfDesc
+from src.handlers.genetics import Genome
 
 
 class Forest:
@@ -53,7 +54,8 @@ class Forest:
             x = origin_x + int(r * math.cos(theta))
             y = origin_y + int(r * math.sin(theta))
 
-            yield x, y
+            # Patches near an edge spill over to the other side, like critters do
+            yield x % self.env_surface.get_width(), y % self.env_surface.get_height()
 
     def create_plant_patch(self):
         self.radii += 10
@@ -71,6 +73,46 @@ class Forest:
         self.plants.remove(plant)
 
 
+class PopulationLedger:
+    """Running head counts and fitness totals, overall and per species.
+
+    Critters report fitness changes here as they happen, and Species registers
+    births and deaths, so averages never need a pass over the population.
+    """
+
+    def __init__(self):
+        self.count = {"total": 0}
+        self.fitness = {"total": 0}
+        self.colors = {}
+
+    def register(self, critter):
+        critter.ledger = self
+        self.count["total"] += 1
+        self.count[critter.species] = self.count.get(critter.species, 0) + 1
+        self.colors[critter.species] = critter.color
+        self.add_fitness(critter.species, critter.fitness)
+
+    def unregister(self, critter):
+        self.add_fitness(critter.species, -critter.fitness)
+        critter.ledger = None
+        self.count["total"] -= 1
+        self.count[critter.species] -= 1
+
+        if self.count[critter.species] == 0:
+            del self.count[critter.species]
+            del self.fitness[critter.species]
+            del self.colors[critter.species]
+
+    def add_fitness(self, species, delta):
+        self.fitness["total"] += delta
+        self.fitness[species] = self.fitness.get(species, 0) + delta
+
+    def average_fitness(self, species="total"):
+        if not self.count.get(species):
+            return 0
+        return self.fitness[species] / self.count[species]
+
+
 class Species:
     def __init__(self, context=None) -> None:
         self.neuron_manager = context["neuron_manager"]
@@ -78,16 +120,22 @@ class Species:
         self.surface = context["env_surface"]
         self.critters = []
         self.dead_critters = []
+        # Critters created since the neighbor index was last rebuilt.
+        self.newborns = []
+        self.ledger = PopulationLedger()
+        self.store = agents.CritterStore()
 
     def create_species(self, n, context):
         context["genome"]["neuron_manager"] = self.neuron_manager
         for _ in range(n):
-            self.critters.append(
-                agents.Critter(
-                    surface=self.surface,
-                    context=context.copy(),
-                )
+            critter = agents.Critter(
+                surface=self.surface,
+                context=context.copy(),
+                store=self.store,
             )
+            self.critters.append(critter)
+            self.newborns.append(critter)
+            self.ledger.register(critter)
 
         return self.critters
 
@@ -97,19 +145,33 @@ class Species:
 
     def step(self, events):
         response = None
+        # Everyone senses the same world before anyone acts, so the brains of
+        # the whole population can be evaluated together in one batch.
+        acting = self.store.begin_step()
+        observations = [critter.genome.observe(critter) for critter in acting]
+        outputs = Genome.forward_batch(
+            [critter.genome for critter in acting], observations
+        )
+        self.neuron_manager.actuate(acting, outputs)
+        self.store.end_step(self.surface.get_size())
+
         for critter in self.critters.copy():
-            response = critter.step(events) or response
             if not critter.alive:
                 self.critters.remove(critter)
                 self.dead_critters.append(critter)
+                self.ledger.unregister(critter)
+                self.store.remove(critter)
 
             if critter.FETUS:
-                self.critters.append(
-                    agents.Critter(
-                        surface=self.surface,
-                        context=critter.FETUS.copy(),
-                    )
+                child = agents.Critter(
+                    surface=self.surface,
+                    context=critter.FETUS.copy(),
+                    store=self.store,
+                    mutate=True,
                 )
+                self.critters.append(child)
+                self.newborns.append(child)
+                self.ledger.register(child)
                 critter.FETUS = None
         return response
 
@@ -159,27 +221,14 @@ class Species:
         return None
 
     def get_species_count(self, species):
-        return sum(1 for s in self.critters if s.species == species)
+        return self.ledger.count.get(species, 0)
 
     def get_critter_count(self):
-        count = {"total": 0}
-        fitness = {"total": 0}
-        species_colors = {}  # Maps species → color
-
-        for i in self.critters:
-            # Species name and color
-            species_name = i.species  # Get species name
-            species_colors[species_name] = i.color  # Store species color
-
-            # Population count
-            count["total"] += 1
-            count[species_name] = count.get(species_name, 0) + 1
-
-            # fitness count
-            fitness["total"] += i.fitness
-            fitness[species_name] = fitness.get(species_name, 0) + i.fitness
-
-        return count, fitness, species_colors
+        return (
+            dict(self.ledger.count),
+            dict(self.ledger.fitness),
+            dict(self.ledger.colors),
+        )
 
 
 class Counter:
@@ -0,0 +1,799 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+
+def wrapped_delta(a, b, size=None):
+    """Returns the shortest offset from coordinate `a` to `b` on a ring of `size`."""
+    delta = b - a
+    if size:
+        delta = (delta + size / 2) % size - size / 2
+    return delta
+
+
+def wrapped_distance(a, b, world_size=None):
+    """Minimum-image distance between points `a` and `b` in a toroidal world."""
+    width, height = world_size or (None, None)
+    return math.hypot(
+        wrapped_delta(a[0], b[0], width), wrapped_delta(a[1], b[1], height)
+    )
+
+
+def squares_overlap(a, b, reach, world_size=None):
+    """Checks whether squares centered on `a` and `b` overlap, allowing for
+    wraparound at the edges. `reach` is the sum of their half widths."""
+    width, height = world_size or (None, None)
+    dx = wrapped_delta(a[0], b[0], width)
+    dy = wrapped_delta(a[1], b[1], height)
+    return abs(dx) < reach and abs(dy) < reach
+
+
+def critter_positions(critters):
+    """Centers of `critters` as an (N, 2) array, gathered from the x and y
+    columns of their stores."""
+    slots = np.fromiter((critter.slot for critter in critters), np.intp, len(critters))
+    stores = [critter.store for critter in critters]
+    positions = np.empty((len(critters), 2))
+    if len(set(map(id, stores))) == 1:  # One Species, the usual case
+        positions[:, 0] = stores[0].x[slots]
+        positions[:, 1] = stores[0].y[slots]
+        return positions
+
+    rows = defaultdict(list)
+    for row, store in enumerate(stores):
+        rows[store].append(row)
+    for store, members in rows.items():
+        positions[members, 0] = store.x[slots[members]]
+        positions[members, 1] = store.y[slots[members]]
+    return positions
+
+
+class SpatialGrid:
+    """Uniform grid bucketing items, such as the rows of a position array, by
+    the cell their center falls in.
+
+    Built once per tick so proximity queries only look at the handful of cells
+    around a critter instead of the whole population. Given a `world_size` the
+    grid wraps around like the environment does, so queries near an edge pick
+    up the cells on the opposite side.
+    """
+
+    def __init__(self, cell_size, reach=0, world_size=None):
+        self.world_size = world_size
+        # How far beyond a query square an indexed item's center may lie and
+        # still overlap it (its half extent plus any movement since insertion).
+        self.reach = reach
+        self.cells = defaultdict(list)
+
+        cell_size = max(1, cell_size)
+        if world_size:
+            # Stretch cells so they tile the world exactly, then wrapping a
+            # cell index is the same as wrapping the position.
+            self.columns = max(1, int(world_size[0] // cell_size))
+            self.rows = max(1, int(world_size[1] // cell_size))
+            self.cell_size = (
+                world_size[0] / self.columns,
+                world_size[1] / self.rows,
+            )
+        else:
+            self.columns = self.rows = None
+            self.cell_size = (math.ceil(cell_size), math.ceil(cell_size))
+
+    def _cell(self, x, y):
+        cx = int(x // self.cell_size[0])
+        cy = int(y // self.cell_size[1])
+        if self.world_size:
+            return cx % self.columns, cy % self.rows
+        return cx, cy
+
+    def _span(self, low, high, size, count):
+        """Cell indices covering [low, high] along one axis, wrapped if needed."""
+        first, last = int(low // size), int(high // size)
+        if count is None:
+            return range(first, last + 1)
+        if last - first + 1 >= count:
+            return range(count)
+        return [index % count for index in range(first, last + 1)]
+
+    def insert(self, item, center):
+        self.cells[self._cell(*center)].append(item)
+
+    def insert_many(self, items, centers):
+        """Files each of `items` under the cell of the matching row of
+        `centers`, an (N, 2) array."""
+        columns = (centers[:, 0] // self.cell_size[0]).astype(int)
+        rows = (centers[:, 1] // self.cell_size[1]).astype(int)
+        if self.world_size:
+            columns %= self.columns
+            rows %= self.rows
+        cells = self.cells
+        for item, cell in zip(items, zip(columns.tolist(), rows.tolist())):
+            cells[cell].append(item)
+
+    def _spans(self, center, half_size):
+        x, y = center
+        reach = half_size + self.reach
+        columns = self._span(x - reach, x + reach, self.cell_size[0], self.columns)
+        rows = self._span(y - reach, y + reach, self.cell_size[1], self.rows)
+        return columns, rows
+
+    def cells_covering(self, center, half_size):
+        """Returns the keys of the cells that could hold items overlapping the
+        square of `half_size` around `center`."""
+        columns, rows = self._spans(center, half_size)
+        return [(cx, cy) for cx in columns for cy in rows]
+
+    def candidates(self, center, half_size):
+        """Returns indexed items in the cells that could overlap the square."""
+        columns, rows = self._spans(center, half_size)
+        found = []
+        if len(columns) * len(rows) > len(self.cells):
+            # Sparse grid: cheaper to walk the occupied cells than the range
+            columns, rows = set(columns), set(rows)
+            for (cx, cy), bucket in self.cells.items():
+                if cx in columns and cy in rows:
+                    found.extend(bucket)
+            return found
+
+        for cx in columns:
+            for cy in rows:
+                bucket = self.cells.get((cx, cy))
+                if bucket:
+                    found.extend(bucket)
+        return found
+
+
+class HierarchicalGrid:
+    """Stack of uniform grids whose cell sizes double from level to level.
+
+    Each item goes to the finest level whose cells are at least as wide as
+    its square, so small and large squares never share a cell size. A query visits
+    a few cells per level whatever its own size, which keeps mixed populations
+    (5px next to 100px vision radii) as cheap to search as uniform ones.
+    """
+
+    def __init__(self, base_size, slack=0, world_size=None):
+        self.base_size = max(1, base_size)
+        # Items can move this far between indexing and being queried.
+        self.slack = slack
+        self.world_size = world_size
+        self.levels = {}
+
+    @classmethod
+    def from_arrays(cls, rows, centers, half_sizes, slack=0, world_size=None):
+        """Indexes `rows` of the `centers` and `half_sizes` arrays."""
+        rows = np.asarray(rows, np.intp)
+        sizes = 2 * half_sizes[rows]
+        grid = cls(sizes.min() if len(rows) else 1, slack, world_size)
+        levels = np.ceil(np.log2(np.maximum(sizes, 1) / grid.base_size))
+        levels = np.maximum(levels, 0).astype(int)
+        for level in np.unique(levels).tolist():
+            members = rows[levels == level]
+            grid._grid(level).insert_many(members.tolist(), centers[members])
+        return grid
+
+    def _level(self, size):
+        return max(0, math.ceil(math.log2(max(size, 1) / self.base_size)))
+
+    def _grid(self, level):
+        if level not in self.levels:
+            cell_size = self.base_size * 2**level
+            self.levels[level] = SpatialGrid(
+                cell_size, reach=cell_size / 2 + self.slack, world_size=self.world_size
+            )
+        return self.levels[level]
+
+    def insert(self, item, center, half_size):
+        self._grid(self._level(2 * half_size)).insert(item, center)
+
+    def candidates(self, center, half_size):
+        """Returns indexed items in the cells that could overlap the square."""
+        found = []
+        for grid in self.levels.values():
+            found.extend(grid.candidates(center, half_size))
+        return found
+
+
+class DensityGrid:
+    """Per-tick occupancy counts of object centers on a grid of `cell_size`
+    pixel cells, with a summed-area table on top, so its size follows the
+    world rather than the population.
+
+    Cells wholly inside a box are summed with four table reads. Only the
+    objects in the cells the box edges cut through are compared against the
+    box itself, so counts are exact; those cells are contiguous runs of the
+    objects sorted by column and by row. Boxes are counted in bulk. Given a
+    `world_size` wrapped copies of the centers within `margin` pixels of an
+    edge are added across the seam, so boxes reaching up to `margin` pixels
+    beyond the world still count what lies on the far side.
+    """
+
+    def __init__(self, centers, cell_size, margin=0, world_size=None):
+        centers = np.asarray(centers, float).reshape(-1, 2)
+        if world_size:
+            width, height = world_size
+            shifts = [
+                (dx, dy) for dx in (-width, 0, width) for dy in (-height, 0, height)
+            ]
+            centers = np.concatenate([centers + shift for shift in shifts])
+            inside = (
+                (centers > -margin).all(axis=1)
+                & (centers[:, 0] < width + margin)
+                & (centers[:, 1] < height + margin)
+            )
+            centers = centers[inside]
+            origin = np.array([-margin, -margin], float)
+            extent = np.array([width + 2 * margin, height + 2 * margin], float)
+        elif len(centers):
+            origin = centers.min(axis=0)
+            extent = centers.max(axis=0) - origin
+        else:
+            origin = extent = np.zeros(2)
+
+        self.cell_size = cell_size
+        self.origin = origin
+        # An empty border of cells all round, so boxes are clipped to empty cells.
+        self.shape = tuple((np.floor(extent / cell_size).astype(int) + 3).tolist())
+        columns, rows = self._cells(centers[:, 0], centers[:, 1])
+
+        # Centers sorted by column then row, and by row then column, next to
+        # the sorted cell keys.
+        by_column = columns * self.shape[1] + rows
+        by_row = rows * self.shape[0] + columns
+        order = np.argsort(by_column, kind="stable")
+        self.column_major, self.column_keys = centers[order], by_column[order]
+        order = np.argsort(by_row, kind="stable")
+        self.row_major, self.row_keys = centers[order], by_row[order]
+
+        counts = np.bincount(by_column, minlength=self.shape[0] * self.shape[1])
+        self.table = np.zeros((self.shape[0] + 1, self.shape[1] + 1), np.int64)
+        table = self.table[1:, 1:]
+        table[:] = counts.reshape(self.shape)
+        np.cumsum(table, axis=0, out=table)
+        np.cumsum(table, axis=1, out=table)
+
+    def _cells(self, xs, ys):
+        columns = np.floor((xs - self.origin[0]) / self.cell_size).astype(np.int64)
+        rows = np.floor((ys - self.origin[1]) / self.cell_size).astype(np.int64)
+        columns = np.clip(columns + 1, 0, self.shape[0] - 1)
+        rows = np.clip(rows + 1, 0, self.shape[1] - 1)
+        return columns, rows
+
+    def count(self, lefts, tops, rights, bottoms):
+        """Numbers of indexed centers strictly inside each of the boxes, given
+        as arrays of their edges."""
+        edges = [np.asarray(edge, float) for edge in (lefts, tops, rights, bottoms)]
+        x0, y0 = self._cells(edges[0], edges[1])
+        x1, y1 = self._cells(edges[2], edges[3])
+
+        # Cells strictly between the edge cells lie wholly inside the box.
+        inner = (x1 - x0 > 1) & (y1 - y0 > 1)
+        a, b = np.where(inner, x0 + 1, 0), np.where(inner, x1, 0)
+        c, d = np.where(inner, y0 + 1, 0), np.where(inner, y1, 0)
+        table = self.table
+        counts = table[b, d] - table[a, d] - table[b, c] + table[a, c]
+
+        # The edge columns in full, then the edge rows between them.
+        boxes = np.arange(len(x0))
+        twice = x1 != x0
+        columns = np.concatenate([x0, x1[twice]])
+        owners = np.concatenate([boxes, boxes[twice]])
+        first = columns * self.shape[1] + y0[owners]
+        last = columns * self.shape[1] + y1[owners]
+        counts += self._count_runs(
+            self.column_major, self.column_keys, first, last, owners, edges
+        )
+
+        between = x1 - x0 > 1
+        twice = between & (y1 != y0)
+        rows = np.concatenate([y0[between], y1[twice]])
+        owners = np.concatenate([boxes[between], boxes[twice]])
+        first = rows * self.shape[0] + x0[owners] + 1
+        last = rows * self.shape[0] + x1[owners] - 1
+        counts += self._count_runs(
+            self.row_major, self.row_keys, first, last, owners, edges
+        )
+        return counts
+
+    def _count_runs(self, centers, keys, first, last, owners, edges):
+        """Counts, per box, the centers with cell keys in [first, last] that lie
+        strictly inside the box that owns the run."""
+        starts = np.searchsorted(keys, first, "left")
+        lengths = np.searchsorted(keys, last, "right") - starts
+        total = int(lengths.sum())
+        if not total:
+            return 0
+
+        # Flat indices of every center in every run, and the box it is checked against.
+        ends = np.cumsum(lengths)
+        indices = np.arange(total) + np.repeat(starts - (ends - lengths), lengths)
+        owners = np.repeat(owners, lengths)
+        xs, ys = centers[indices, 0], centers[indices, 1]
+        lefts, tops, rights, bottoms = (edge[owners] for edge in edges)
+        inside = (xs > lefts) & (xs < rights) & (ys > tops) & (ys < bottoms)
+        return np.bincount(owners[inside], minlength=len(edges[0]))
+
+
+class NeighborSearch:
+    """Answers the spatial queries for one tick, choosing per tick between a
+    vectorized all-pairs scan and per-species hierarchical grids.
+
+    A NumPy pairwise matrix is cheapest for small populations, while the grids
+    win once the population is large and spread out. The chosen strategy is
+    kept in `strategy`; passing one to the constructor pins it, for benchmarks.
+    Besides the perception scan, `critters_near` serves the other lookups that
+    need critters around a point, such as defense strikes and mouse picking.
+
+    Everything is indexed by its center and the half width of its square:
+    critter centers come straight from the position columns of their stores,
+    and their rects are left to drawing and picking.
+
+    With a `coherence_slack` the grid scan reuses each critter's neighbors
+    across ticks: it queries a square `coherence_slack` pixels wider than the
+    vision square and keeps that candidate set until the critter could have
+    drifted out of it, `coherence_ticks` ticks pass, or objects appear in the
+    cells it covers. Results stay exact; the slack only trades fewer queries
+    for larger candidate sets.
+    """
+
+    BRUTE_FORCE = "brute_force"
+    GRID = "grid"
+
+    # Relative per-critter costs, measured against checking one grid candidate
+    # in Python: fixed overheads of a matrix lookup and of a grid query, and the
+    # cost each pair adds to the NumPy scan.
+    CANDIDATE_COST = 1.0
+    SCAN_COST = 8.0
+    QUERY_COST = 13.0
+    PAIR_COST = 0.05
+    # Upper bound on the pairwise scan, which holds a few N x N matrices.
+    MAX_BRUTE_FORCE = 2000
+    # Pixel size of the cells density sensors count in.
+    DENSITY_CELL_SIZE = 8
+    # Pixel size of the cells appearances are tracked in for perception reuse.
+    CHANGE_CELL_SIZE = 64
+
+    def __init__(
+        self, world_size=None, strategy=None, coherence_slack=0, coherence_ticks=10
+    ):
+        self.world_size = world_size
+        self.forced_strategy = strategy
+        self.strategy = None
+
+        self.coherence_slack = coherence_slack
+        self.coherence_ticks = coherence_ticks
+        self.tick = 0
+        self.neighborhoods = {}
+        self.changes = SpatialGrid(self.CHANGE_CELL_SIZE, world_size=world_size)
+        self.changed_at = {}
+        self.indexed = set()
+        self.critters, self.plants = [], []
+        self.update([], [])
+
+    def update(self, critters, plants):
+        """Indexes this tick's critters and plants with the cheapest strategy.
+        Density tables wait until the first densities() call after it."""
+        self.tick += 1
+        previous = self.critters, self.plants
+        self.critters = list(critters)
+        self.plants = list(plants)
+        self.row_of = {id(critter): i for i, critter in enumerate(self.critters)}
+        self.plant_column = {id(plant): j for j, plant in enumerate(self.plants)}
+        self.plant_removed = np.zeros(len(self.plants), bool)
+
+        codes = {}
+        self.species_codes = np.array(
+            [codes.setdefault(c.species, len(codes)) for c in self.critters], int
+        )
+        self.species = list(codes)
+        self.centers = critter_positions(self.critters)
+        self.half_sizes = np.array([c.half_size for c in self.critters], float)
+        self.plant_centers = np.array([p.position for p in self.plants], float).reshape(
+            -1, 2
+        )
+        self.plant_half_sizes = np.array([p.half_size for p in self.plants], float)
+        self.speed = max((critter.max_speed for critter in critters), default=0)
+        if self.coherence_slack:
+            self._track_changes(critters, plants, *previous)
+
+        self.strategy = self.forced_strategy or self.choose_strategy(critters)
+        if self.strategy == self.BRUTE_FORCE:
+            self._build_matrices(critters, plants)
+        else:
+            self._build_grids(critters, plants)
+        self.species_densities = self.plant_densities = None
+
+    def choose_strategy(self, critters):
+        """Estimates the cost of both strategies from the population size and the
+        spread of vision squares, and returns the cheaper one."""
+        n = len(critters)
+        if n > self.MAX_BRUTE_FORCE:
+            return self.GRID
+        if n < 2:
+            return self.BRUTE_FORCE
+
+        widths = np.fromiter((2 * critter.half_size for critter in critters), float, n)
+        if self.world_size:
+            area = self.world_size[0] * self.world_size[1]
+        else:
+            centers = critter_positions(critters)
+            extent = centers.max(axis=0) - centers.min(axis=0) + widths.max()
+            area = extent[0] * extent[1]
+
+        # A query against a level spans its own square plus that level's cells,
+        # which are up to twice as wide as the squares filed there. The spread
+        # of vision radii enters through the cross term between the two.
+        query_area = (
+            np.mean(widths**2) + 4 * np.mean(widths) ** 2 + 4 * np.mean(widths**2)
+        )
+        candidates = min(n, n * query_area / area)
+
+        grid_cost = self.QUERY_COST + candidates * self.CANDIDATE_COST
+        brute_force_cost = self.SCAN_COST + n * self.PAIR_COST
+        if brute_force_cost < grid_cost:
+            return self.BRUTE_FORCE
+        return self.GRID
+
+    def remove(self, obj):
+        """Drops a plant that was eaten mid-tick from further results. Returns
+        whether it was still there to drop."""
+        column = self.plant_column.get(id(obj))
+        if column is None or self.plant_removed[column]:
+            return False
+        self.plant_removed[column] = True
+        if self.strategy == self.BRUTE_FORCE:
+            self.food_distances[:, column] = np.inf
+        return True
+
+    def scan(self, critter):
+        """Returns the critter's nearest same-species, other-species and food
+        neighbors as (object, distance) pairs."""
+        if self.strategy == self.BRUTE_FORCE:
+            return self._scan_matrices(critter)
+        return self._scan_grids(critter)
+
+    def densities(self, critters):
+        """Counts, for each of `critters`, the same-species critters,
+        other-species critters and plants whose squares overlap its vision
+        square, as of the last update. Returns three arrays."""
+        if self.species_densities is None:
+            self._build_densities()
+
+        centers = critter_positions(critters)
+        half_sizes = np.array([critter.half_size for critter in critters], float)
+        species = np.array([critter.species for critter in critters], object)
+        same = np.zeros(len(critters), np.int64)
+        other = np.zeros(len(critters), np.int64)
+        for population, partitions in self.species_densities.items():
+            counts = self._count_overlapping(centers, half_sizes, partitions)
+            mine = species == population
+            same += np.where(mine, counts, 0)
+            other += np.where(mine, 0, counts)
+
+        food = self._count_overlapping(centers, half_sizes, self.plant_densities)
+        return same, other, food
+
+    def __contains__(self, critter):
+        """Whether `critter` was indexed by the last update()."""
+        return id(critter) in self.row_of
+
+    def critters_near(self, center, half_size):
+        """Returns live critters whose vision squares overlap the square of
+        `half_size` around `center`."""
+        if self.strategy == self.BRUTE_FORCE:
+            rows = np.arange(len(self.critters))
+        else:
+            found = []
+            for grid in self.species_grids.values():
+                found.extend(grid.candidates(center, half_size))
+            rows = np.array(found, np.intp)
+
+        # Screen against the tick's snapshot with some slack for movement, then
+        # confirm the survivors against their current positions.
+        reach = half_size + self.speed + self.half_sizes[rows]
+        dx, dy = self._offsets(center, self.centers[rows])
+        rows = rows[(np.abs(dx) < reach) & (np.abs(dy) < reach)]
+        critters = [self.critters[row] for row in rows.tolist()]
+
+        reach = half_size + self.half_sizes[rows]
+        dx, dy = self._offsets(center, critter_positions(critters))
+        overlap = (np.abs(dx) < reach) & (np.abs(dy) < reach)
+        return [
+            critter
+            for critter, overlaps in zip(critters, overlap.tolist())
+            if overlaps and critter.alive
+        ]
+
+    # --- DENSITY COUNTS ---
+
+    def _build_densities(self):
+        critter_size = self.half_sizes.max(initial=0)
+        plant_size = self.plant_half_sizes.max(initial=0)
+        margin = critter_size + max(critter_size, plant_size)
+
+        def build(centers, half_sizes, members):
+            # One grid per square size, so each count knows the exact reach.
+            return [
+                (
+                    DensityGrid(
+                        centers[members & (half_sizes == half_size)],
+                        self.DENSITY_CELL_SIZE,
+                        margin,
+                        self.world_size,
+                    ),
+                    half_size,
+                )
+                for half_size in np.unique(half_sizes[members]).tolist()
+            ]
+
+        self.species_densities = {
+            population: build(self.centers, self.half_sizes, self.species_codes == code)
+            for code, population in enumerate(self.species)
+        }
+        self.plant_densities = build(
+            self.plant_centers,
+            self.plant_half_sizes,
+            np.ones(len(self.plants), bool),
+        )
+
+    def _count_overlapping(self, centers, half_sizes, partitions):
+        """Squares overlap when their centers are closer than the two half widths
+        combined."""
+        total = np.zeros(len(centers), np.int64)
+        for grid, other_half_size in partitions:
+            reach = half_sizes + other_half_size
+            total += grid.count(
+                centers[:, 0] - reach,
+                centers[:, 1] - reach,
+                centers[:, 0] + reach,
+                centers[:, 1] + reach,
+            )
+        return total
+
+    # --- GRID STRATEGY ---
+
+    def _build_grids(self, critters, plants):
+        # Grids hold rows of the snapshot arrays, so candidates are filtered
+        # with NumPy rather than object by object. Objects can move this far
+        # between indexing and being queried.
+        slack = self.speed
+
+        # One grid per species, so same/other-species queries pick partitions
+        # instead of comparing species names candidate by candidate.
+        self.species_grids = {
+            species: HierarchicalGrid.from_arrays(
+                np.flatnonzero(self.species_codes == code),
+                self.centers,
+                self.half_sizes,
+                slack=slack,
+                world_size=self.world_size,
+            )
+            for code, species in enumerate(self.species)
+        }
+        self.plant_grid = HierarchicalGrid.from_arrays(
+            np.arange(len(self.plants)),
+            self.plant_centers,
+            self.plant_half_sizes,
+            slack=slack,
+            world_size=self.world_size,
+        )
+
+    def _scan_grids(self, critter):
+        row = self.row_of.get(id(critter))
+        if row is None:  # Born after the grids were built
+            center = critter.position
+        else:
+            center = tuple(self.centers[row].tolist())
+        half_size = critter.half_size
+        if self.coherence_slack:
+            same, other, plants = self._reuse_neighborhood(critter, center)
+        else:
+            same, other, plants = self._query_neighborhood(critter, center, half_size)
+
+        if row is not None:
+            same = same[same != row]
+        plants = plants[~self.plant_removed[plants]]
+        critters = self.critters, self.centers, self.half_sizes
+        food = self.plants, self.plant_centers, self.plant_half_sizes
+        return {
+            "closest_same_critter": self._closest(center, half_size, same, *critters),
+            "closest_other_critter": self._closest(center, half_size, other, *critters),
+            "closest_food": self._closest(center, half_size, plants, *food),
+        }
+
+    def _query_neighborhood(self, critter, center, half_size):
+        """Rows of the same-species critters, other-species critters and plants
+        in the grid cells around the square of `half_size` around `center`.
+        _closest does the exact overlap test, so candidates are not filtered
+        here."""
+        same, other = [], []
+        for species, grid in self.species_grids.items():
+            found = grid.candidates(center, half_size)
+            if species == critter.species:
+                same.extend(found)
+            else:
+                other.extend(found)
+        plants = self.plant_grid.candidates(center, half_size)
+        return (
+            np.array(same, np.intp),
+            np.array(other, np.intp),
+            np.array(plants, np.intp),
+        )
+
+    def _offsets(self, center, centers):
+        """Offsets of `centers` from `center`, wrapped around the world."""
+        width, height = self.world_size or (None, None)
+        dx = centers[:, 0] - center[0]
+        dy = centers[:, 1] - center[1]
+        if width:
+            dx = (dx + width / 2) % width - width / 2
+            dy = (dy + height / 2) % height - height / 2
+        return dx, dy
+
+    def _closest(self, center, half_size, rows, objects, centers, half_sizes):
+        """Nearest of the `rows` of `objects` whose square overlaps the square
+        around `center`, as (object, distance)."""
+        if not len(rows):
+            return None, math.inf
+
+        dx, dy = self._offsets(center, centers[rows])
+        reach = half_size + half_sizes[rows]
+        overlap = (np.abs(dx) < reach) & (np.abs(dy) < reach)
+        distances = np.where(overlap, np.hypot(dx, dy), np.inf)
+
+        while True:
+            index = int(np.argmin(distances))
+            distance = distances[index]
+            if distance == np.inf:
+                return None, math.inf
+
+            obj = objects[rows[index]]
+            if getattr(obj, "alive", True):
+                return obj, float(distance)
+            # Died earlier this tick; nobody should see it anymore.
+            distances[index] = np.inf
+
+    # --- PERCEPTION REUSE ---
+
+    def _track_changes(self, critters, plants, last_critters, last_plants):
+        """Stamps the cells of objects that were not indexed last tick, drops
+        the neighborhoods of critters that died since, and maps last tick's
+        rows to this tick's."""
+        indexed = set(critters)
+        indexed.update(plants)
+        for obj in indexed - self.indexed:
+            for cell in self.changes.cells_covering(obj.position, obj.half_size):
+                self.changed_at[cell] = self.tick
+        # Deaths and eaten plants need no stamp: their rows map to -1 below.
+        self.indexed = indexed
+
+        self.critter_remap = np.array(
+            [self.row_of.get(id(c), -1) for c in last_critters], np.intp
+        )
+        self.plant_remap = np.array(
+            [self.plant_column.get(id(p), -1) for p in last_plants], np.intp
+        )
+
+        self.neighborhoods = {
+            critter: neighborhood
+            for critter, neighborhood in self.neighborhoods.items()
+            if critter.alive and self.tick - neighborhood["tick"] < self.coherence_ticks
+        }
+
+    def _is_fresh(self, center, neighborhood):
+        """Checks that nothing outside the candidate set can have come into view."""
+        age = self.tick - neighborhood["tick"]
+        if age >= self.coherence_ticks:
+            return False
+        # Rows can only be carried over from one tick to the next.
+        if neighborhood["rows_tick"] < self.tick - 1:
+            return False
+
+        # Everything else moved at most `speed` a tick on top of our own drift.
+        drift = wrapped_distance(neighborhood["anchor"], center, self.world_size)
+        if drift + age * self.speed > self.coherence_slack:
+            return False
+
+        changed_at = self.changed_at
+        return all(
+            changed_at.get(cell, 0) <= neighborhood["tick"]
+            for cell in neighborhood["cells"]
+        )
+
+    def _reuse_neighborhood(self, critter, center):
+        neighborhood = self.neighborhoods.get(critter)
+        if neighborhood is None or not self._is_fresh(center, neighborhood):
+            half_size = critter.half_size + self.coherence_slack
+            neighborhood = {
+                "tick": self.tick,
+                "anchor": center,
+                "cells": self.changes.cells_covering(center, half_size),
+                "rows_tick": self.tick,
+                "candidates": self._query_neighborhood(critter, center, half_size),
+            }
+            self.neighborhoods[critter] = neighborhood
+        elif neighborhood["rows_tick"] < self.tick:
+            # Carry last tick's rows over, dropping what is gone.
+            same, other, plants = (
+                remap[rows]
+                for remap, rows in zip(
+                    (self.critter_remap, self.critter_remap, self.plant_remap),
+                    neighborhood["candidates"],
+                )
+            )
+            neighborhood["candidates"] = (
+                same[same >= 0],
+                other[other >= 0],
+                plants[plants >= 0],
+            )
+            neighborhood["rows_tick"] = self.tick
+
+        # _closest narrows these down to what the vision square covers now.
+        return neighborhood["candidates"]
+
+    # --- BRUTE FORCE STRATEGY ---
+
+    def _pairwise(self, centers, half_sizes, other_centers, other_half_sizes):
+        """Distances and overlaps between two sets of squares, as (N, M) arrays."""
+        width, height = self.world_size or (None, None)
+        dx = other_centers[None, :, 0] - centers[:, None, 0]
+        dy = other_centers[None, :, 1] - centers[:, None, 1]
+        if width:
+            dx = (dx + width / 2) % width - width / 2
+            dy = (dy + height / 2) % height - height / 2
+
+        reach = half_sizes[:, None] + other_half_sizes[None, :]
+        overlap = (np.abs(dx) < reach) & (np.abs(dy) < reach)
+        return np.hypot(dx, dy), overlap
+
+    def _build_matrices(self, critters, plants):
+        centers, half_sizes = self.centers, self.half_sizes
+        species = self.species_codes
+
+        distances, overlap = self._pairwise(centers, half_sizes, centers, half_sizes)
+        same = species[:, None] == species[None, :]
+        np.fill_diagonal(overlap, False)
+        self.same_distances = np.where(overlap & same, distances, np.inf)
+        self.other_distances = np.where(overlap & ~same, distances, np.inf)
+
+        distances, overlap = self._pairwise(
+            centers, half_sizes, self.plant_centers, self.plant_half_sizes
+        )
+        self.food_distances = np.where(overlap, distances, np.inf)
+
+    def _nearest(self, distances, row, objects):
+        """Closest live object on a row of a distance matrix, dropping dead critters."""
+        if not objects:  # np.argmin fails on an empty row
+            return None, math.inf
+
+        while True:
+            column = int(np.argmin(distances[row]))
+            distance = distances[row, column]
+            if distance == np.inf:
+                return None, math.inf
+
+            obj = objects[column]
+            if getattr(obj, "alive", True):
+                return obj, float(distance)
+            # Died earlier this tick; nobody should see it anymore.
+            self.same_distances[:, column] = np.inf
+            self.other_distances[:, column] = np.inf
+
+    def _scan_matrices(self, critter):
+        row = self.row_of.get(id(critter))
+        if row is None:  # Born after the matrices were built
+            return dict.fromkeys(
+                ("closest_same_critter", "closest_other_critter", "closest_food"),
+                (None, math.inf),
+            )
+
+        return {
+            "closest_same_critter": self._nearest(
+                self.same_distances, row, self.critters
+            ),
+            "closest_other_critter": self._nearest(
+                self.other_distances, row, self.critters
+            ),
+            "closest_food": self._nearest(self.food_distances, row, self.plants),
+        }
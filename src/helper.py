@@ -251,12 +251,12 @@ def split_word(text, max_size):
     return [text[i : i + max_size] for i in range(0, len(text), max_size)]
 
 
-def dfs(graph, node=None, visited: list = None, group: list = None):
+def dfs(graph, node=None, visited: set = None, group: list = None):
     if visited is None:
-        visited = []
+        visited = set()
 
     if node is not None:
-        visited.append(node)
+        visited.add(node)
         if group is not None:
             group.append(node)
         for neighbor in graph.get(node, set()):
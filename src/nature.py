@@ -6,7 +6,7 @@ from src.enums import Attributes, EventType, MessagePacket, Pages
 from src.handlers import genetics
 import src.handlers.organisms as organisms
 from src.handlers.ui import UIHandler
-from src.config import image_assets
+from src.config import PERCEPTION_MAX_AGE, PERCEPTION_SLACK, image_assets
 
 
 class Nature:
@@ -28,7 +28,11 @@ class Nature:
 
         self.ui_handler.initialize_screen(screen=Pages.HOME)
         env_surface = self.ui_handler.get_component(name="EnvComponent").surface
-        self.neuron_manager = genetics.NeuronManager()
+        self.neuron_manager = genetics.NeuronManager(
+            world_size=env_surface.get_size(),
+            perception_slack=PERCEPTION_SLACK,
+            perception_max_age=PERCEPTION_MAX_AGE,
+        )
 
         self.species = organisms.Species(
             context={
@@ -95,6 +99,7 @@ class Nature:
             self.species.get_critters(),
             self.forest.get_plants(),
         )
+        self.species.newborns.clear()
 
         self.clock.tick(1000)
         self.truncated = False
@@ -139,6 +144,8 @@ class Nature:
                 "time": self.time_steps,
                 "paused": self.paused,
                 "plants": self.forest.get_plants(),
+                "neighbor_search": self.neuron_manager.neighbor_search,
+                "newborns": self.species.newborns,
                 "selected_critter": self.selected_critter["data"],
             }
         )